@@ -0,0 +1,221 @@
+"""Кэш в файле SQLite, общий для всех процессов сервера на машине.
+
+LocMemCache свой у каждого процесса: попадания делятся на число
+процессов, а новое поколение кэша, начатое в одном процессе, не видят
+остальные. Здесь записи лежат в одной базе SQLite в режиме WAL: читатели
+не блокируют друг друга и писателя, а incr - один атомарный UPDATE.
+
+Размер базы ограничен OPTIONS['MAX_BYTES']: когда процесс записал десятую
+часть бюджета, он удаляет просроченные записи и, если их мало, давно не
+читанные. Время чтения обновляется не чаще раза в TOUCH_INTERVAL секунд,
+чтобы попадания не превращались в запись.
+
+Целые числа хранятся как INTEGER, остальное - в pickle. Нужен SQLite
+3.35 или новее (UPDATE ... RETURNING).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+TOUCH_INTERVAL = 60
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+def _dump(value):
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _load(value):
+    if isinstance(value, int):
+        return value
+    return pickle.loads(value)
+
+
+def _size(key, stored):
+    return len(key) + (8 if isinstance(stored, int) else len(stored))
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_bytes = options.get('MAX_BYTES', 256 * 1024 * 1024)
+        self._local = threading.local()
+        self._written_lock = threading.Lock()
+        self._written = 0
+
+    @property
+    def _connection(self):
+        # Соединение своё у потока и у процесса: после fork старое
+        # соединение использовать нельзя.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.location, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _expires(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else time.time() + timeout
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._connection.execute(
+            'SELECT key, value, accessed FROM cache WHERE key IN '
+            f'({",".join("?" * len(keys))}) '
+            'AND (expires IS NULL OR expires > ?)',
+            (*keys, now)).fetchall()
+        stale = [key for key, _, accessed in rows
+                 if accessed < now - TOUCH_INTERVAL]
+        if stale:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key IN '
+                f'({",".join("?" * len(stale))})', (now, *stale))
+        return {keys[key]: _load(value) for key, value, _ in rows}
+
+    def get(self, key, default=None, version=None):
+        missing = object()
+        found = self.get_many([key], version=version).get(key, missing)
+        return default if found is missing else found
+
+    def has_key(self, key, version=None):
+        return self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time())).fetchone() is not None
+
+    def _write(self, sql, items, timeout):
+        expires = self._expires(timeout)
+        now = time.time()
+        rows = []
+        for key, value in items:
+            stored = _dump(value)
+            rows.append((key, stored, expires, now, _size(key, stored)))
+        cursor = self._connection.executemany(sql, rows)
+        self._written_bytes(sum(row[-1] for row in rows))
+        return cursor.rowcount
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+            [(self._key(key, version), value)
+             for key, value in data.items()], timeout)
+        return []
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Просроченная запись не мешает добавить новую.
+        return self._write(
+            'INSERT INTO cache VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires, accessed = excluded.accessed, '
+            'size = excluded.size '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= '
+            'excluded.accessed',
+            [(self._key(key, version), value)], timeout) > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), self._key(key, version),
+             time.time())).rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        row = self._connection.execute(
+            'UPDATE cache SET value = value + ? WHERE key = ? '
+            "AND typeof(value) = 'integer' "
+            'AND (expires IS NULL OR expires > ?) RETURNING value',
+            (delta, self._key(key, version), time.time())).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._connection.execute(
+                'DELETE FROM cache WHERE key IN '
+                f'({",".join("?" * len(keys))})', keys)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединения живут весь поток: открывать базу на каждый запрос
+        # дороже, чем держать её открытой.
+        pass
+
+    def _written_bytes(self, size):
+        # Подсчёт размера базы - полный проход, поэтому чистим после
+        # каждой записанной десятой части бюджета, а не после каждой записи.
+        with self._written_lock:
+            self._written += size
+            if self._written < self.max_bytes // 10:
+                return
+            self._written = 0
+        self.evict()
+
+    def evict(self, budget=None):
+        """Удаляет просроченные и давно не читанные записи сверх бюджета.
+
+        Возвращает число удалённых записей.
+        """
+        if budget is None:
+            budget = self.max_bytes
+        connection = self._connection
+        removed = connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)).rowcount
+        total = connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        # Чистим с запасом, как и дисковый кэш картинок.
+        excess = total - budget * 9 // 10 if total > budget else 0
+        victims = []
+        for key, size in connection.execute(
+                'SELECT key, size FROM cache ORDER BY accessed'):
+            if excess <= 0:
+                break
+            victims.append(key)
+            excess -= size
+        for start in range(0, len(victims), 500):
+            chunk = victims[start:start + 500]
+            removed += connection.execute(
+                'DELETE FROM cache WHERE key IN '
+                f'({",".join("?" * len(chunk))})', chunk).rowcount
+        return removed
@@ -0,0 +1,13 @@
+from django.core.checks import Error, Tags, register
+
+from . import templating
+
+
+@register(Tags.templates)
+def check_templates_compile(app_configs, **kwargs):
+    """Каждый шаблон проекта должен компилироваться."""
+    return [
+        Error(f'Шаблон {name} не компилируется: {error}',
+              obj=name, id='core.E001')
+        for name, error in templating.compile_all()
+    ]
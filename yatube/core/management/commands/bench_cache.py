@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+COUNTER_KEY = 'bench:generation'
+
+
+def run_worker(job):
+    """Один процесс сервера: чтения со сборкой при промахе и incr.
+
+    Возвращает (попадания, чтения, секунды на чтения, последний incr).
+    """
+    backend_path, location, options, seed = job
+    cache = import_string(backend_path)(location, {'TIMEOUT': None})
+    rng = random.Random(seed)
+    payload = b'x' * options['value_bytes']
+    weights = [1 / rank for rank in range(1, options['keys'] + 1)]
+    keys = rng.choices(range(options['keys']), weights,
+                       k=options['operations'])
+    cache.add(COUNTER_KEY, 0)
+    hits = 0
+    get_seconds = 0.0
+    counter = 0
+    for number, key in enumerate(keys):
+        started = time.perf_counter()
+        found = cache.get(f'bench:page:{key}')
+        get_seconds += time.perf_counter() - started
+        if found is None:
+            # Сборка страницы при промахе.
+            time.sleep(options['compute_ms'] / 1000)
+            cache.set(f'bench:page:{key}', payload)
+        else:
+            hits += 1
+        if number % 10 == 0:
+            counter = cache.incr(COUNTER_KEY)
+    return hits, len(keys), get_seconds, counter
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает кэши под нагрузкой нескольких процессов: доля '
+            'попаданий, скорость и видимость incr из других процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=2000,
+                            help='чтений в каждом процессе')
+        parser.add_argument('--keys', type=int, default=500)
+        parser.add_argument('--compute-ms', type=float, default=1.0,
+                            help='цена сборки значения при промахе')
+        parser.add_argument('--value-bytes', type=int, default=4096)
+        parser.add_argument('--backend', action='append',
+                            choices=sorted(BACKENDS),
+                            help='какие кэши сравнивать, по умолчанию все')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['operations'] < 1:
+            raise CommandError('--workers и --operations больше нуля')
+        workload = {name: options[name] for name in (
+            'operations', 'keys', 'compute_ms', 'value_bytes')}
+        context = multiprocessing.get_context('spawn')
+        for name in options['backend'] or sorted(BACKENDS):
+            with tempfile.TemporaryDirectory() as directory:
+                location = os.path.join(directory, 'cache.sqlite3')
+                jobs = [(BACKENDS[name], location, workload, seed)
+                        for seed in range(options['workers'])]
+                with context.Pool(options['workers']) as pool:
+                    started = time.perf_counter()
+                    results = pool.map(run_worker, jobs)
+                    elapsed = time.perf_counter() - started
+            self.report(name, results, elapsed)
+
+    def report(self, name, results, elapsed):
+        hits = sum(result[0] for result in results)
+        reads = sum(result[1] for result in results)
+        get_seconds = sum(result[2] for result in results)
+        increments = sum(len(range(0, result[1], 10)) for result in results)
+        # В общем кэше последний incr видит инкременты всех процессов.
+        seen = max(result[3] for result in results)
+        self.stdout.write(
+            f'{name:<8} попаданий {hits / reads:6.1%}, '
+            f'{reads / elapsed:8.0f} чтений/с, '
+            f'get {get_seconds / reads * 1e6:7.1f} мкс, '
+            f'incr видно {seen} из {increments}')
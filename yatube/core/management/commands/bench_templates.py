@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.forms import AuthenticationForm
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.template import engines
+from django.test import RequestFactory
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import templating
+from core.metrics import percentile
+from posts import thumbnails
+from posts.forms import CommentForm, PostForm
+from posts.models import Comment, Group, Post
+from users.forms import CreationForm
+
+User = get_user_model()
+POSTS_PER_PAGE = 10
+# Прежняя единственная миниатюра карточки - с ней сравниваются варианты.
+LEGACY_CARD_OPTIONS = {'quality': 95, 'optimize': True}
+
+# Какую форму ждёт шаблон; остальным достаётся форма поста.
+FORMS = {
+    'posts/comments.html': CommentForm,
+    'posts/post_detail.html': CommentForm,
+    'users/login.html': AuthenticationForm,
+    'users/signup.html': CreationForm,
+}
+
+
+def synthetic_context(pages, comments):
+    """Несохранённые объекты: посты и комментарии не читаются из базы."""
+    now = timezone.now()
+    author = User(pk=1, username='leo', first_name='Лев',
+                  last_name='Толстой')
+    group = Group(pk=1, title='Классика', slug='classics',
+                  description='Русская классика ' * 10)
+    posts = [
+        Post(pk=number, author=author, group=group,
+             text=f'Пост {number}. ' + 'Все счастливые семьи похожи. ' * 20,
+             pub_date=now - timedelta(hours=number))
+        for number in range(1, pages * POSTS_PER_PAGE + 1)
+    ]
+    page = Paginator(posts, POSTS_PER_PAGE).page(1)
+    return {
+        'page_obj': page,
+        'posts': page.object_list,
+        'post_list': page.object_list,
+        'post': posts[0],
+        'group': group,
+        'author': author,
+        'posts_sum': len(posts),
+        'post_count': len(posts),
+        'following': False,
+        'comments': [
+            Comment(pk=number, post=posts[0], author=author,
+                    text='Комментарий ' * 5, pub_date=now)
+            for number in range(1, comments + 1)
+        ],
+        'is_edit': False,
+        'page_key': 'page:1',
+        'path': '/missing/',
+    }
+
+
+def card_image_bytes(source_path):
+    """Байты прежней миниатюры 960x339 и вариантов карточки.
+
+    Для каждой ширины браузер берёт самый лёгкий формат, поэтому в
+    сравнение идёт самый лёгкий вариант ширины.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        targets = [
+            (os.path.join(directory, f'{width}.{image_format.lower()}'),
+             thumbnails.card_size(width), image_format)
+            for image_format in thumbnails.FORMATS
+            for width in thumbnails.CARD_WIDTHS
+        ]
+        thumbnails.render_variants(source_path, targets)
+        variants = {f'{image_format} {size[0]}w': os.path.getsize(path)
+                    for path, size, image_format in targets}
+        legacy_path = os.path.join(directory, 'legacy.jpg')
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+        ImageOps.fit(image, thumbnails.CARD_SIZE, Image.LANCZOS,
+                     centering=(0.5, 0.5)).save(
+            legacy_path, 'JPEG', **LEGACY_CARD_OPTIONS)
+        legacy = os.path.getsize(legacy_path)
+    lightest = {
+        f'{width}w': min(size for name, size in variants.items()
+                         if name.endswith(f' {width}w'))
+        for width in thumbnails.CARD_WIDTHS
+    }
+    return {
+        'legacy_jpeg_960w': legacy,
+        'variants': variants,
+        'lightest': lightest,
+        'share_of_legacy': {width: round(size / legacy, 3)
+                            for width, size in lightest.items()},
+    }
+
+
+class Command(BaseCommand):
+    help = ('Рендерит каждый шаблон проекта на синтетических данных и '
+            'пишет перцентили времени. Фрагменты {% cache %} по умолчанию '
+            'каждый раз собираются заново.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--pages', type=int, default=10,
+                            help='страниц в паджинаторе')
+        parser.add_argument('--comments', type=int, default=20)
+        parser.add_argument('--warm', action='store_true',
+                            help='не менять поколение фрагментов: мерить '
+                                 'рендер с попаданиями в кэш')
+        parser.add_argument('--image',
+                            help='картинка: сравнить байты вариантов '
+                                 'карточки с прежней миниатюрой')
+        parser.add_argument('--output', help='файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля')
+        engine = engines['django']
+        context = synthetic_context(options['pages'], options['comments'])
+        request = RequestFactory().get('/')
+        request.user = context['author']
+        versions = count(time.time_ns())
+        results = {}
+        for name in templating.template_names(engine):
+            template = engine.get_template(name)
+            form = FORMS.get(name, PostForm)
+            timings = []
+            try:
+                for _ in range(options['iterations'] + 1):
+                    if not options['warm']:
+                        context['cache_version'] = next(versions)
+                    context['form'] = form()
+                    started = time.perf_counter()
+                    html = template.render(context, request)
+                    timings.append((time.perf_counter() - started) * 1000)
+            except Exception as error:
+                self.stderr.write(f'{name}: {type(error).__name__}: {error}')
+                continue
+            # Первый рендер компилирует вложенные шаблоны - не считаем.
+            timings = timings[1:]
+            results[name] = {
+                'p50_ms': round(percentile(timings, 0.50), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'bytes': len(html.encode()),
+            }
+            self.stdout.write(
+                f'{name:<40} p50 {results[name]["p50_ms"]:>7.2f} '
+                f'p95 {results[name]["p95_ms"]:>7.2f} мс, '
+                f'байт {results[name]["bytes"]}')
+        report = {'iterations': options['iterations'],
+                  'warm': options['warm'],
+                  'templates': results}
+        if options['image']:
+            report['card_image'] = images = card_image_bytes(
+                options['image'])
+            self.stdout.write(
+                f'прежняя миниатюра 960w: байт {images["legacy_jpeg_960w"]}')
+            for width, size in images['lightest'].items():
+                self.stdout.write(
+                    f'самый лёгкий вариант {width}: байт {size}, '
+                    f'{images["share_of_legacy"][width]:.0%} прежней')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+                file.write('\n')
@@ -0,0 +1,165 @@
+"""Раздача медиафайлов прямо из WSGI, мимо Django.
+
+MediaApplication оборачивает WSGI-приложение Django и отвечает на
+запросы к MEDIA_URL сам: без middleware, сессий и шаблонов. Файл
+отдаётся через wsgi.file_wrapper, и сервер (gunicorn, uWSGI) шлёт его
+системным sendfile. Поддерживаются условные запросы по ETag и дате
+изменения и запросы диапазона байтов. Файлы с хэшем содержимого в имени
+никогда не меняются, поэтому кэшируются браузером на год.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.wsgi import get_path_info
+from django.utils._os import safe_join
+
+BLOCK_SIZE = 64 * 1024
+# Имя из ContentAddressedStorage: .../ab/<sha256>.ext
+CONTENT_HASHED = re.compile(r'/([0-9a-f]{2})/\1[0-9a-f]{62}\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def status_line(status):
+    status = HTTPStatus(status)
+    return f'{status.value} {status.phrase}'
+
+
+def parse_range(header, size):
+    """(начало, конец) одного диапазона, None без Range или False.
+
+    Несколько диапазонов не поддерживаем: на них отвечаем целым файлом,
+    как разрешает RFC 7233.
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end or not size:
+            return False
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+class MediaApplication:
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        # Сервер уже раскодировал %XX; PATH_INFO - байты UTF-8,
+        # прочитанные как latin-1, как их и читает Django.
+        path = get_path_info(environ)
+        if not path.startswith(settings.MEDIA_URL):
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response,
+                          path[len(settings.MEDIA_URL):])
+
+    def error(self, start_response, status, headers=()):
+        start_response(status_line(status),
+                       [('Content-Length', '0'), *headers])
+        return [b'']
+
+    def serve(self, environ, start_response, name):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            return self.error(start_response, HTTPStatus.METHOD_NOT_ALLOWED,
+                              [('Allow', 'GET, HEAD')])
+        full_path, stat = self.find(name)
+        if stat is None:
+            return self.error(start_response, HTTPStatus.NOT_FOUND)
+
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        headers = [
+            ('ETag', etag),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('Cache-Control', IMMUTABLE if CONTENT_HASHED.search(
+                '/' + name) else REVALIDATE),
+            ('Accept-Ranges', 'bytes'),
+        ]
+        if self.not_modified(environ, etag, stat.st_mtime):
+            start_response(status_line(HTTPStatus.NOT_MODIFIED), headers)
+            return [b'']
+
+        content_type, encoding = mimetypes.guess_type(full_path)
+        headers.append(
+            ('Content-Type', content_type or 'application/octet-stream'))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+
+        size = stat.st_size
+        byte_range = None
+        # If-Range с устаревшим ETag: файл изменился, отдаём целиком.
+        if environ.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = parse_range(environ.get('HTTP_RANGE'), size)
+        if byte_range is False:
+            return self.error(
+                start_response, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                [('Content-Range', f'bytes */{size}')])
+
+        status = HTTPStatus.OK
+        start, length = 0, size
+        if byte_range:
+            status = HTTPStatus.PARTIAL_CONTENT
+            start, end = byte_range
+            length = end - start + 1
+            headers.append(('Content-Range', f'bytes {start}-{end}/{size}'))
+        headers.append(('Content-Length', str(length)))
+        start_response(status_line(status), headers)
+        if method == 'HEAD':
+            return [b'']
+
+        file = open(full_path, 'rb')
+        if status == HTTPStatus.OK and 'wsgi.file_wrapper' in environ:
+            # Сервер отдаст файл целиком через sendfile.
+            return environ['wsgi.file_wrapper'](file, BLOCK_SIZE)
+        return read_range(file, start, length)
+
+    def find(self, name):
+        """Путь и stat файла внутри MEDIA_ROOT или (None, None)."""
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, name)
+            stat = os.stat(full_path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return None, None
+        if not os.path.isfile(full_path):
+            return None, None
+        return full_path, stat
+
+    def not_modified(self, environ, etag, mtime):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f'W/{etag}' in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
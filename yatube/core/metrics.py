@@ -0,0 +1,201 @@
+"""Замеры производительности запроса.
+
+Middleware заводит на запрос объект RequestMetrics и кладёт его в
+contextvar. Обёртки SQL, кэша и шаблонов пишут в него, только если он
+есть, поэтому вне выборки они почти ничего не стоят. Итоги запроса
+складываются в гистограммы процесса по имени адреса.
+
+Отдельно от выборки считаются попадания именованных кэшей приложения:
+это два целых на обращение, их дёшево считать всегда.
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.template import base
+
+# Верхние границы корзин: миллисекунды для времени, штуки для счётчиков.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+METRICS = ('total_ms', 'sql_ms', 'sql_queries', 'template_ms',
+           'cache_hits', 'cache_misses')
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_ms = 0.0
+        self.sql_queries = 0
+        self.template_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.total_ms = 0.0
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    def values(self):
+        return {name: getattr(self, name) for name in METRICS}
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing."""
+        return ', '.join((
+            f'db;dur={self.sql_ms:.2f};desc="{self.sql_queries} queries"',
+            f'tpl;dur={self.template_ms:.2f}',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+            f'total;dur={self.total_ms:.2f}',
+        ))
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу: не требует много замеров."""
+    ordered = sorted(values)
+    rank = max(math.ceil(share * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, share):
+        """Оценка сверху: граница корзины, где набирается доля замеров."""
+        needed = share * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= needed:
+                return bound
+        return None
+
+    def as_dict(self):
+        labels = [f'le_{bound}' for bound in BUCKETS] + ['inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'mean': round(self.sum / self.count, 3) if self.count else None,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+_lock = threading.Lock()
+_histograms = defaultdict(lambda: {name: Histogram() for name in METRICS})
+_lookups = defaultdict(lambda: [0, 0])
+
+
+def record(view_name, metrics):
+    with _lock:
+        histograms = _histograms[view_name]
+        for name, value in metrics.values().items():
+            histograms[name].add(value)
+
+
+def snapshot():
+    with _lock:
+        return {view_name: {name: histogram.as_dict()
+                            for name, histogram in histograms.items()}
+                for view_name, histograms in _histograms.items()}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _lookups.clear()
+
+
+def count_lookup(cache_name, hit):
+    """Попадание или промах именованного кэша приложения."""
+    with _lock:
+        _lookups[cache_name][0 if hit else 1] += 1
+
+
+def lookups():
+    """Попадания, промахи и доля попаданий по именам кэшей."""
+    with _lock:
+        return {name: {'hits': hits,
+                       'misses': misses,
+                       'hit_rate': round(hits / (hits + misses), 4)}
+                for name, (hits, misses) in _lookups.items()}
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrapper."""
+    metrics = current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if metrics is not None:
+            metrics.sql_ms += (time.perf_counter() - started) * 1000
+            metrics.sql_queries += 1
+
+
+def instrument_cache(backend):
+    """Считает попадания и промахи get и get_many экземпляра кэша.
+
+    Экземпляры бэкендов свои у каждого потока, поэтому обёртку ставим
+    один раз на экземпляр, при первом замеренном запросе в потоке.
+    """
+    if getattr(backend, '_metrics_instrumented', False):
+        return
+    get = backend.get
+    get_many = backend.get_many
+    missing = object()
+
+    def counted_get(key, default=None, version=None):
+        value = get(key, missing, version=version)
+        metrics = current.get()
+        if metrics is not None:
+            if value is missing:
+                metrics.cache_misses += 1
+            else:
+                metrics.cache_hits += 1
+        return default if value is missing else value
+
+    def counted_get_many(keys, version=None):
+        keys = list(keys)
+        found = get_many(keys, version=version)
+        metrics = current.get()
+        if metrics is not None:
+            metrics.cache_hits += len(found)
+            metrics.cache_misses += len(keys) - len(found)
+        return found
+
+    backend.get = counted_get
+    backend.get_many = counted_get_many
+    backend._metrics_instrumented = True
+
+
+def install_template_timing():
+    """Замеряет внешний render шаблона; вложенные include не считаются."""
+    if getattr(base.Template.render, 'instrumented', False):
+        return
+    render = base.Template.render
+
+    def timed_render(self, context):
+        metrics = current.get()
+        if metrics is None or context.template is not None:
+            return render(self, context)
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics.template_ms += (time.perf_counter() - started) * 1000
+
+    timed_render.instrumented = True
+    base.Template.render = timed_render
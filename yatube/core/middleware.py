@@ -0,0 +1,142 @@
+import hashlib
+import random
+from contextlib import ExitStack
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import cc_delim_re, get_conditional_response
+
+from posts import caching
+
+from . import metrics, tiered
+
+
+class PerformanceMetricsMiddleware:
+    """Замеряет SQL, шаблоны, кэш и полное время части запросов.
+
+    Доля замеряемых запросов задаётся PERFORMANCE_SAMPLE_RATE. Замеры
+    уходят в заголовок Server-Timing и в гистограммы по имени адреса.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.install_template_timing()
+
+    def __call__(self, request):
+        rate = getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0)
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+        for alias in settings.CACHES:
+            metrics.instrument_cache(caches[alias])
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        request_metrics.finish()
+        match = getattr(request, 'resolver_match', None)
+        metrics.record(match.view_name if match else '<unresolved>',
+                       request_metrics)
+        response['Server-Timing'] = request_metrics.server_timing()
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """Готовые страницы из ANONYMOUS_PAGE_CACHE_VIEWS для гостей.
+
+    Стоит до сессий, CSRF и авторизации: попадание не трогает ни базу,
+    ни шаблоны. Гость - запрос без cookie сессии и сообщений. Ключ - путь
+    и позиция в ленте (page или cursor), остальные параметры не влияют.
+
+    Вместе со страницей хранятся поколения кэша, которые прочитала
+    вьюха (caching.page_version). Страница отдаётся, только если они не
+    изменились, поэтому новый пост или комментарий виден сразу. Ответы с
+    cookie (например, с токеном CSRF) не кэшируются, как и страницы с
+    прошлым фрагментом (tiered.served_stale): их тело старше поколений.
+    Заголовки из Vary, кроме Cookie, входят в проверку: от cookie ответ
+    для гостя не зависит.
+    """
+
+    BYPASS_COOKIES = (settings.SESSION_COOKIE_NAME, 'messages')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable_request(request):
+            return self.get_response(request)
+        key = self.cache_key(request)
+        entry = cache.get(key)
+        hit = entry is not None and self.is_fresh(request, entry)
+        metrics.count_lookup('anonymous_page', hit)
+        if hit:
+            return self.cached_response(request, entry)
+        response = self.get_response(request)
+        self.store(key, request, response)
+        return response
+
+    def is_cacheable_request(self, request):
+        if (not settings.ANONYMOUS_PAGE_CACHE_TIMEOUT
+                or request.method not in ('GET', 'HEAD')
+                or any(name in request.COOKIES
+                       for name in self.BYPASS_COOKIES)):
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.view_name in settings.ANONYMOUS_PAGE_CACHE_VIEWS
+
+    def cache_key(self, request):
+        position = urlencode(sorted(
+            (name, request.GET[name]) for name in ('cursor', 'page')
+            if name in request.GET))
+        raw = f'{request.path}?{position}'
+        return f'anonymous_page:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def vary_values(self, request, vary):
+        names = (name.strip() for name in cc_delim_re.split(vary))
+        meta = ('HTTP_' + name.upper().replace('-', '_') for name in names
+                if name and name.lower() != 'cookie')
+        return {name: request.META.get(name) for name in meta}
+
+    def is_fresh(self, request, entry):
+        stored = entry['generations']
+        return (self.vary_values(request, entry['vary']) == entry['varied']
+                and caching.generations(*stored) == stored)
+
+    def cached_response(self, request, entry):
+        response = HttpResponse(entry['content'])
+        for header, value in entry['headers']:
+            response[header] = value
+        return get_conditional_response(
+            request, etag=response.get('ETag'), response=response)
+
+    def store(self, key, request, response):
+        generations = getattr(request, 'page_generations', None)
+        cache_control = response.get('Cache-Control', '')
+        if (generations is None
+                or tiered.served_stale(request)
+                or response.status_code != 200
+                or response.streaming
+                or response.cookies
+                or 'private' in cache_control
+                or 'no-store' in cache_control):
+            return
+        vary = response.get('Vary', '')
+        cache.set(key, {
+            'content': response.content,
+            'headers': list(response.items()),
+            'generations': generations,
+            'vary': vary,
+            'varied': self.vary_values(request, vary),
+        }, settings.ANONYMOUS_PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_references(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredFile = apps.get_model('core', 'StoredFile')
+    totals = (Post.objects.exclude(image='').values('image')
+              .annotate(total=Count('pk')).order_by()
+              .values_list('image', 'total'))
+    StoredFile.objects.bulk_create(
+        StoredFile(name=name, references=total) for name, total in totals)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
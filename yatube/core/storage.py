@@ -0,0 +1,114 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Имя файла - хэш его содержимого, поэтому одна и та же картинка,
+загруженная много раз, лежит на диске один раз, а миниатюры, которые
+называются по имени исходника, создаются для неё тоже один раз. Сколько
+моделей ссылается на файл, хранит StoredFile; файл удаляется, когда
+уходит последняя ссылка.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File, locks
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла - sha256 содержимого.
+
+    Каталог из upload_to сохраняется: posts/ab/abcdef....jpg. Если такой
+    файл уже есть, он не перезаписывается, и save просто возвращает имя.
+    """
+
+    def hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content_hash(content))
+        if not self.exists(name):
+            self._save_atomic(name, content)
+        return name.replace('\\', '/')
+
+    def _save_atomic(self, name, content):
+        # Одинаковые файлы могут сохранять параллельно, в том числе потоки
+        # одного процесса: пишем во временный файл и переименовываем,
+        # содержимое у всех одно.
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        partial = f'{full_path}.{os.getpid()}.{threading.get_ident()}.part'
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), partial)
+        else:
+            with open(partial, 'wb') as file:
+                locks.lock(file, locks.LOCK_EX)
+                for chunk in content.chunks():
+                    file.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(partial, self.file_permissions_mode)
+        os.replace(partial, full_path)
+
+
+def retain(name):
+    """Добавляет ссылку на файл."""
+    updated = StoredFile.objects.filter(name=name).update(
+        references=F('references') + 1)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            StoredFile.objects.create(name=name, references=1)
+    except IntegrityError:
+        # Запись успел создать параллельный запрос.
+        StoredFile.objects.filter(name=name).update(
+            references=F('references') + 1)
+
+
+def release(name, storage=default_storage):
+    """Убирает ссылку на файл; без ссылок файл удаляется после коммита.
+
+    Возвращает True, если это была последняя ссылка.
+    """
+    StoredFile.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1)
+    deleted, _ = StoredFile.objects.filter(
+        name=name, references=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: _delete_unused(name, storage))
+    return bool(deleted)
+
+
+def _delete_unused(name, storage):
+    # Пока шла транзакция, ту же картинку могли загрузить снова.
+    if StoredFile.objects.filter(name=name).exists():
+        return
+    try:
+        storage.delete(name)
+    except (OSError, SuspiciousFileOperation):
+        # Запись уже закоммичена, файл подберёт сборщик мусора.
+        logger.exception('Не удалось удалить файл %s', name)
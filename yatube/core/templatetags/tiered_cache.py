@@ -0,0 +1,58 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.cache import CacheNode
+
+from .. import tiered
+
+# Тот же {% cache %}, что в django.templatetags.cache, но через
+# двухуровневый кэш. Поколение передаётся отдельно: version=...
+# Пока новое поколение фрагмента собирает другой процесс, отдаётся
+# последнее собранное, а запрос помечается tiered.mark_stale().
+# Фрагмент, при сборке которого запрос был помечен (прошлый вложенный
+# фрагмент, заглушка миниатюры), не сохраняется.
+
+register = template.Library()
+
+
+class TieredCacheNode(CacheNode):
+    def __init__(self, nodelist, expire_time_var, fragment_name, vary_on,
+                 version):
+        super().__init__(nodelist, expire_time_var, fragment_name, vary_on,
+                         None)
+        self.version = version
+
+    def render(self, context):
+        expire_time = self.expire_time_var.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        stale_key = None
+        if self.version is not None:
+            stale_key = make_template_fragment_key(
+                f'{self.fragment_name}:stale', vary_on)
+            vary_on.append(self.version.resolve(context))
+        request = getattr(context, 'request', None)
+        marked = tiered.served_stale(request)
+        return tiered.get_or_build(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(context), expire_time, stale_key,
+            lambda: tiered.mark_stale(request),
+            lambda: tiered.served_stale(request) == marked)
+
+
+@register.tag('cache')
+def do_cache(parser, token):
+    """{% cache время имя [переменные...] [version=поколение] %}."""
+    nodelist = parser.parse(('endcache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.')
+    version = None
+    if len(tokens) > 3 and tokens[-1].startswith('version='):
+        version = parser.compile_filter(tokens[-1][len('version='):])
+        tokens = tokens[:-1]
+    return TieredCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]], version)
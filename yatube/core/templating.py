@@ -0,0 +1,37 @@
+"""Компиляция всех шаблонов проекта заранее.
+
+В рабочем режиме шаблоны грузит кэширующий загрузчик: каждый шаблон
+компилируется один раз на процесс. compile_all() проходит по всем
+шаблонам из каталогов TEMPLATES['DIRS'] и заодно наполняет этот кэш,
+поэтому первые запросы после запуска не платят за компиляцию, а сломанный
+шаблон обнаруживается при старте, а не у посетителя.
+"""
+import os
+
+from django.template import TemplateSyntaxError, engines
+
+
+def template_names(engine=None):
+    """Имена шаблонов проекта относительно их каталогов, по порядку."""
+    engine = engine or engines['django']
+    names = set()
+    for directory in engine.engine.dirs:
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                if file_name.endswith('.html'):
+                    path = os.path.relpath(os.path.join(root, file_name),
+                                           directory)
+                    names.add(path.replace(os.sep, '/'))
+    return sorted(names)
+
+
+def compile_all(engine=None):
+    """Компилирует все шаблоны; возвращает [(имя, ошибка)] неудачных."""
+    engine = engine or engines['django']
+    errors = []
+    for name in template_names(engine):
+        try:
+            engine.get_template(name)
+        except TemplateSyntaxError as error:
+            errors.append((name, error))
+    return errors
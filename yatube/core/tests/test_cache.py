@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from ..cache import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        """Запись одного экземпляра видна другому, как другому процессу."""
+        other = self.make_cache()
+        self.cache.set('page', {'html': '<p>'})
+        self.cache.set('generation', 5, None)
+        self.assertEqual(other.get('page'), {'html': '<p>'})
+        self.assertEqual(other.get_many(['page', 'missing']),
+                         {'page': {'html': '<p>'}})
+        self.assertEqual(other.incr('generation'), 6)
+        self.assertEqual(self.cache.get('generation'), 6)
+        other.delete('page')
+        self.assertIsNone(self.cache.get('page'))
+
+    def test_add_and_expiry(self):
+        """add не перезаписывает живую запись, но заменяет просроченную."""
+        self.assertTrue(self.cache.add('key', 'first'))
+        self.assertFalse(self.cache.add('key', 'second'))
+        self.assertEqual(self.cache.get('key'), 'first')
+        with mock.patch('core.cache.time.time', return_value=1e12):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertTrue(self.cache.add('key', 'third'))
+            self.assertEqual(self.cache.get('key'), 'third')
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('flag', True)
+        self.assertIs(self.cache.get('flag'), True)
+
+    def test_concurrent_incr_is_atomic(self):
+        """Одновременные incr из разных соединений не теряются."""
+        self.cache.set('counter', 0, None)
+
+        def increment():
+            cache = self.make_cache()
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_evicts_least_recently_read(self):
+        """Сверх бюджета удаляются давно не читанные записи."""
+        cache = self.make_cache(MAX_BYTES=10 ** 9)
+        with mock.patch('core.cache.time.time') as now:
+            for number in range(10):
+                now.return_value = 1000 + number
+                cache.set(f'key{number}', b'x' * 1000, None)
+            now.return_value = 2000
+            cache.get('key0')
+            removed = cache.evict(budget=6000)
+        self.assertEqual(removed, 5)
+        self.assertIsNotNone(cache.get('key0'))
+        self.assertIsNone(cache.get('key1'))
+        self.assertIsNotNone(cache.get('key9'))
+
+    def test_bench_cache(self):
+        """Бенчмарк показывает, что incr общего кэша видны всем."""
+        output = StringIO()
+        call_command('bench_cache', workers=2, operations=20, keys=5,
+                     compute_ms=0, backend=['sqlite'], stdout=output)
+        self.assertIn('incr видно 4 из 4', output.getvalue())
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+from wsgiref.util import FileWrapper, setup_testing_defaults
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from ..media import IMMUTABLE, MediaApplication
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+HASHED = 'posts/ab/ab' + '0' * 62 + '.jpg'
+CONTENT = bytes(range(256)) * 4
+
+
+def django_app(environ, start_response):
+    start_response('200 OK', [])
+    return [b'django']
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_URL='/media/')
+class MediaApplicationTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts/ab'))
+        for name in (HASHED, 'posts/plain.txt', 'posts/фото 100%.txt'):
+            with open(os.path.join(TEMP_MEDIA_ROOT, name), 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, path, **headers):
+        environ = {'PATH_INFO': path, 'wsgi.file_wrapper': FileWrapper}
+        environ.update(
+            (f'HTTP_{key.upper()}', value) for key, value in headers.items())
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(response_headers)
+
+        body = MediaApplication(django_app)(environ, start_response)
+        response['body'] = b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        return response
+
+    def test_other_paths_go_to_django(self):
+        self.assertEqual(self.get('/posts/1/')['body'], b'django')
+
+    def test_full_file_with_cache_headers(self):
+        response = self.get(f'/media/{HASHED}')
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['body'], CONTENT)
+        self.assertEqual(response['headers']['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['headers']['Content-Type'], 'image/jpeg')
+        plain = self.get('/media/posts/plain.txt')
+        self.assertNotEqual(plain['headers']['Cache-Control'], IMMUTABLE)
+
+    def test_conditional_requests(self):
+        headers = self.get(f'/media/{HASHED}')['headers']
+        by_etag = self.get(f'/media/{HASHED}', if_none_match=headers['ETag'])
+        self.assertEqual(by_etag['status'], 304)
+        self.assertEqual(by_etag['body'], b'')
+        by_date = self.get(f'/media/{HASHED}',
+                           if_modified_since=headers['Last-Modified'])
+        self.assertEqual(by_date['status'], 304)
+        changed = self.get(f'/media/{HASHED}', if_none_match='"other"')
+        self.assertEqual(changed['status'], 200)
+
+    def test_range_requests(self):
+        path = f'/media/{HASHED}'
+        response = self.get(path, range='bytes=10-19')
+        self.assertEqual(response['status'], 206)
+        self.assertEqual(response['body'], CONTENT[10:20])
+        self.assertEqual(response['headers']['Content-Range'],
+                         f'bytes 10-19/{len(CONTENT)}')
+        self.assertEqual(self.get(path, range='bytes=-5')['body'],
+                         CONTENT[-5:])
+        self.assertEqual(self.get(path, range='bytes=1000-')['body'],
+                         CONTENT[1000:])
+        self.assertEqual(self.get(path, range='bytes=5000-')['status'], 416)
+        stale = self.get(path, range='bytes=0-1', if_range='"old"')
+        self.assertEqual(stale['status'], 200)
+
+    def test_non_ascii_names(self):
+        # Сервер отдаёт путь уже без %XX, байты UTF-8 прочитаны как latin-1.
+        path = '/media/posts/фото 100%.txt'.encode().decode('iso-8859-1')
+        response = self.get(path)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['body'], CONTENT)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.get('/media/posts/none.jpg')['status'], 404)
+        self.assertEqual(self.get('/media/../settings.py')['status'], 404)
+        self.assertEqual(self.get('/media/posts')['status'], 404)
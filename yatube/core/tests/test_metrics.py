@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .. import metrics
+
+User = get_user_model()
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1)
+class PerformanceMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.author = User.objects.create_user(username='author')
+        Post.objects.create(author=self.author, text='Пост')
+        self.staff = User.objects.create_user(username='staff',
+                                              is_staff=True)
+        self.client = Client()
+
+    def test_server_timing_header(self):
+        """Замеренный ответ несёт Server-Timing с SQL, шаблоном и кэшем."""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for name in ('db;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            self.assertIn(name, timing)
+
+    def test_histograms_by_view_name(self):
+        """Гистограммы копятся по имени адреса и отдаются только staff."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        index = metrics.snapshot()['posts:index']
+        self.assertEqual(index['total_ms']['count'], 2)
+        self.assertGreater(index['sql_queries']['sum'], 0)
+        self.assertGreater(index['template_ms']['sum'], 0)
+        # Второй запрос берёт страницу из кэша.
+        self.assertGreater(index['cache_hits']['sum'], 0)
+        url = reverse('core:metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        data = self.client.get(url).json()
+        self.assertIn('posts:index', data['views'])
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(metrics.snapshot(), {})
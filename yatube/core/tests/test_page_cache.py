@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Post
+
+from .. import metrics, tiered
+
+User = get_user_model()
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE_TIMEOUT=60)
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='Первый')
+        self.guest = Client()
+        self.index = reverse('posts:index')
+
+    def test_repeated_page_skips_database_and_templates(self):
+        """Повторная страница для гостя отдаётся без базы и шаблонов."""
+        first = self.guest.get(self.index)
+        with self.assertNumQueries(0):
+            second = self.guest.get(self.index, {'utm': 'ignored'})
+        self.assertIsNone(second.context)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(self.guest.get(
+            self.index, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(metrics.lookups()['anonymous_page']['hits'], 2)
+
+    def test_new_content_is_visible_at_once(self):
+        """Новый пост и комментарий сразу видны гостю."""
+        detail = reverse('posts:post_detail',
+                         kwargs={'post_id': self.post.pk})
+        self.guest.get(self.index)
+        self.guest.get(detail)
+        Post.objects.create(author=self.author, text='Второй')
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        self.assertContains(self.guest.get(self.index), 'Второй')
+        self.assertContains(self.guest.get(detail), 'Комментарий')
+
+    def test_page_position_is_part_of_key(self):
+        """Разные страницы ленты кэшируются отдельно."""
+        for number in range(10):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        first = self.guest.get(self.index)
+        second = self.guest.get(self.index, {'page': 2})
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(self.guest.get(self.index, {'page': 2}),
+                            'Первый')
+
+    def test_authenticated_users_bypass_cache(self):
+        """Запросы с сессией всегда идут во вьюху."""
+        self.guest.get(self.index)
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(self.index)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, 'author')
+        self.assertEqual(metrics.lookups()['anonymous_page'],
+                         {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+
+    def test_stale_fragment_is_not_stored(self):
+        """Страницу с прошлым фрагментом не сохраняем под новым поколением."""
+        add = cache.add
+
+        def lock_held(key, *args, **kwargs):
+            # Новое поколение ленты собирает другой процесс.
+            if key.startswith('tiered:lock:'):
+                return False
+            return add(key, *args, **kwargs)
+
+        self.guest.get(self.index)
+        Post.objects.create(author=self.author, text='Второй')
+        with mock.patch.object(tiered.cache, 'add', side_effect=lock_held):
+            stale = self.guest.get(self.index)
+        self.assertNotContains(stale, 'Второй')
+        self.assertContains(self.guest.get(self.index), 'Второй')
+        self.assertEqual(metrics.lookups()['anonymous_page']['hits'], 0)
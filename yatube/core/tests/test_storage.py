@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from posts.models import Post
+
+from .. import storage
+from ..models import StoredFile
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.storage = storage.ContentAddressedStorage()
+        self.author = User.objects.create_user(username='author')
+
+    def upload(self, name='small.gif'):
+        return SimpleUploadedFile(name, SMALL_GIF, content_type='image/gif')
+
+    def test_same_content_is_stored_once(self):
+        """Одинаковое содержимое получает одно имя и один файл."""
+        first = self.storage.save('posts/a.GIF', ContentFile(SMALL_GIF))
+        second = self.storage.save('posts/b.gif', ContentFile(SMALL_GIF))
+        other = self.storage.save('posts/c.gif', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith('posts/'))
+        self.assertTrue(first.endswith('.gif'))
+        self.assertEqual(len(self.storage.listdir(
+            first.rsplit('/', 1)[0])[1]), 1)
+        with self.storage.open(first) as file:
+            self.assertEqual(file.read(), SMALL_GIF)
+
+    def test_parallel_threads_save_same_file(self):
+        """Потоки одного процесса не пишут в один временный файл."""
+        content = SMALL_GIF * 1000
+        names = []
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            threads = [threading.Thread(target=lambda: names.append(
+                self.storage.save('posts/a.gif', ContentFile(content))))
+                for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(set(names)), 1)
+        self.assertEqual(len(names), len(threads))
+        with self.storage.open(names[0]) as file:
+            self.assertEqual(file.read(), content)
+
+    def test_file_lives_while_posts_reference_it(self):
+        """Файл удаляется вместе с последним ссылающимся постом."""
+        with mock.patch('django.db.transaction.on_commit',
+                        side_effect=lambda callback: callback()), \
+                mock.patch('posts.thumbnails._submit'):
+            first = Post.objects.create(author=self.author, text='Раз',
+                                        image=self.upload())
+            second = Post.objects.create(author=self.author, text='Два',
+                                         image=self.upload('copy.gif'))
+            name = first.image.name
+            self.assertEqual(second.image.name, name)
+            self.assertEqual(
+                StoredFile.objects.get(name=name).references, 2)
+            first.delete()
+            self.assertTrue(self.storage.exists(name))
+            self.assertEqual(
+                StoredFile.objects.get(name=name).references, 1)
+            second.image = ''
+            second.save()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
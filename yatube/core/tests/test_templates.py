@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image, ImageDraw, ImageFilter
+
+from .. import checks, templating
+
+
+class TemplatePrecompileTest(TestCase):
+    def test_project_templates_compile(self):
+        """Все шаблоны проекта компилируются, проверка молчит."""
+        self.assertIn('posts/includes/paginator.html',
+                      templating.template_names())
+        self.assertEqual(checks.check_templates_compile(None), [])
+
+    def test_broken_template_is_reported(self):
+        """Сломанный шаблон попадает в ошибки проверки."""
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'broken.html'), 'w') as file:
+                file.write('{% if %}')
+            engine = dict(settings.TEMPLATES[0], DIRS=[directory])
+            with override_settings(TEMPLATES=[engine]):
+                errors = checks.check_templates_compile(None)
+        self.assertEqual([error.obj for error in errors], ['broken.html'])
+        self.assertEqual(errors[0].id, 'core.E001')
+
+    def test_bench_templates(self):
+        """Бенчмарк рендерит каждый шаблон без ошибок."""
+        stderr = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'templates.json')
+            call_command('bench_templates', iterations=2, pages=2,
+                         comments=2, output=output, stdout=StringIO(),
+                         stderr=stderr)
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertEqual(stderr.getvalue(), '')
+        self.assertEqual(sorted(report['templates']),
+                         templating.template_names())
+        self.assertGreater(
+            report['templates']['posts/index.html']['bytes'], 0)
+
+    def test_card_variants_halve_image_bytes(self):
+        """Самый лёгкий вариант каждой ширины вдвое легче прежнего JPEG."""
+        # Похожая на фото картинка: градиент, пятна и немного шума.
+        image = Image.linear_gradient('L').resize((1200, 900)).convert('RGB')
+        draw = ImageDraw.Draw(image)
+        for step in range(60):
+            x, y = step * 97 % 1200, step * 61 % 900
+            draw.ellipse((x, y, x + 40 + step, y + 30 + step),
+                         fill=(step * 4, 255 - step * 4, step * 37 % 256))
+        noise = Image.effect_noise(image.size, 20).convert('RGB')
+        image = Image.blend(image.filter(ImageFilter.GaussianBlur(3)),
+                            noise, 0.15)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'photo.png')
+            image.save(path)
+            output = os.path.join(directory, 'templates.json')
+            call_command('bench_templates', iterations=1, pages=1,
+                         comments=1, image=path, output=output,
+                         stdout=StringIO(), stderr=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)['card_image']
+        self.assertEqual(sorted(report['lightest']), ['480w', '960w'])
+        for width, share in report['share_of_legacy'].items():
+            with self.subTest(width=width):
+                self.assertLessEqual(share, 0.5)
@@ -0,0 +1,96 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+
+from .. import tiered
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        tiered.local.clear()
+        self.builds = 0
+
+    def build(self, value='готово'):
+        self.builds += 1
+        return value
+
+    def test_concurrent_misses_build_once(self):
+        """При одновременных промахах собирает один, остальные ждут."""
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow_build():
+            started.set()
+            release.wait(5)
+            return self.build()
+
+        builder = threading.Thread(target=lambda: results.append(
+            tiered.get_or_build('key', slow_build)))
+        builder.start()
+        started.wait(5)
+        waiter = threading.Thread(target=lambda: results.append(
+            tiered.get_or_build('key', self.build)))
+        waiter.start()
+        release.set()
+        builder.join()
+        waiter.join()
+        self.assertEqual(results, ['готово', 'готово'])
+        self.assertEqual(self.builds, 1)
+
+    def test_serves_stale_while_other_process_rebuilds(self):
+        """Пока ключ собирает другой процесс, отдаётся прошлое значение."""
+        cache.set('stale', 'старое')
+        cache.add(tiered._lock_key('key'), True)
+        request = mock.Mock(spec=[])
+        value = tiered.get_or_build('key', self.build, stale_key='stale',
+                                    on_stale=lambda: tiered.mark_stale(
+                                        request))
+        self.assertEqual(value, 'старое')
+        self.assertEqual(self.builds, 0)
+        self.assertTrue(tiered.served_stale(request))
+
+    def test_refreshes_before_expiry(self):
+        """Ближе к концу срока запись иногда пересобирается заранее."""
+        # Сборка шла 10 секунд, до конца срока минута.
+        cache.set('key', ('первое', time.time() + 60, 10.0))
+        with mock.patch.object(tiered.random, 'random', return_value=0.5):
+            self.assertEqual(tiered.get_or_build('key', self.build, 60),
+                             'первое')
+        with mock.patch.object(tiered.random, 'random', return_value=1e-300):
+            self.assertEqual(tiered.get_or_build('key', self.build, 60),
+                             'готово')
+        self.assertEqual(self.builds, 1)
+
+    @override_settings(TIERED_CACHE_LOCAL_ENTRIES=1)
+    def test_local_tier_keeps_recent_entries(self):
+        """Локальный уровень отвечает без общего кэша и вытесняет старое."""
+        tiered.get_or_build('first', self.build)
+        tiered.get_or_build('second', self.build)
+        cache.clear()
+        tiered.get_or_build('second', self.build)
+        self.assertEqual(self.builds, 2)
+        tiered.get_or_build('first', self.build)
+        self.assertEqual(self.builds, 3)
+
+    def test_cache_tag_serves_last_fragment_during_rebuild(self):
+        """Тег {% cache %} с version= отдаёт прошлое поколение фрагмента."""
+        template = Template(
+            '{% load tiered_cache %}'
+            '{% cache None fragment name version=version %}'
+            '{{ name }} {{ version }}{% endcache %}')
+        self.assertEqual(template.render(Context(
+            {'name': 'index', 'version': 1})), 'index 1')
+        new_key = make_template_fragment_key('fragment', ['index', 2])
+        cache.add(tiered._lock_key(new_key), True)
+        self.assertEqual(template.render(Context(
+            {'name': 'index', 'version': 2})), 'index 1')
+        cache.delete(tiered._lock_key(new_key))
+        self.assertEqual(template.render(Context(
+            {'name': 'index', 'version': 2})), 'index 2')
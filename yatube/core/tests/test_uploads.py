@@ -0,0 +1,79 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import Post
+
+from ..uploads import prepare_image
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_upload(size, image_format='JPEG', name='photo.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', size, (10, 120, 200)).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type=Image.MIME[image_format])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=500,
+                   IMAGE_UPLOAD_MEMORY_LIMIT=1024 * 1024)
+class ImageUploadTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_large_jpeg_is_downscaled_in_draft_mode(self):
+        """JPEG 3000x1000 (9 МБ пикселей) уменьшается в пределах 1 МБ."""
+        with mock.patch('posts.thumbnails._submit'):
+            self.client.post(reverse('posts:post_create'), {
+                'text': 'Большое фото',
+                'image': image_upload((3000, 1000)),
+            })
+        post = Post.objects.get(text='Большое фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (500, 167))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_small_image_is_kept(self):
+        upload = image_upload((40, 30), 'PNG', 'small.png')
+        self.assertIs(prepare_image(upload), upload)
+
+    def test_png_over_memory_limit_is_rejected(self):
+        """Без draft картинка не влезает в предел памяти."""
+        with self.assertRaises(ValidationError) as context:
+            prepare_image(image_upload((3000, 1000), 'PNG', 'big.png'))
+        self.assertEqual(context.exception.code, 'image_too_large')
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_decompression_bomb_is_rejected(self):
+        with self.assertRaises(ValidationError) as context:
+            prepare_image(image_upload((20, 20), 'PNG', 'bomb.png'))
+        self.assertEqual(context.exception.code, 'decompression_bomb')
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=100)
+    def test_upload_over_byte_limit_is_rejected(self):
+        """Обработчик загрузки не пишет лишнее, форма сообщает об ошибке."""
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': 'Слишком большой файл',
+            'image': image_upload((200, 200)),
+        })
+        self.assertFalse(
+            Post.objects.filter(text='Слишком большой файл').exists())
+        self.assertIn('image', response.context['form'].errors)
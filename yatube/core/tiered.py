@@ -0,0 +1,153 @@
+"""Двухуровневый кэш с защитой от одновременной пересборки.
+
+Первый уровень - LRU в памяти процесса, второй - общий кэш default.
+Локальный уровень годится только для ключей, которые не меняют значение:
+в этом проекте ключи фрагментов и страниц содержат поколение данных,
+поэтому после изменения данных запрашивается уже другой ключ. При
+LocMemCache второй уровень и так в памяти процесса, и первый отключают
+(TIERED_CACHE_LOCAL_ENTRIES = 0).
+
+Когда ключа нет, пересобирает значение только один процесс: тот, кто
+первым добавил в общий кэш ключ блокировки. Остальные отдают прошлое
+значение того же фрагмента (stale_key), если оно есть, или ждут готового
+до LOCK_WAIT секунд. Об отданном прошлом значении сообщает on_stale():
+запрос с ним помечается (mark_stale), и такую страницу нельзя сохранять
+и подтверждать валидатором под новыми поколениями. Собранное значение
+не сохраняется, если cacheable() вернёт False: например, в нём заглушка
+вместо ещё не готовых данных.
+
+Записи со сроком жизни пересобираются заранее с вероятностью, растущей
+к концу срока (XFetch): чем дольше сборка, тем раньше начинается
+обновление, и истечение не застаёт всех сразу.
+"""
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2.0
+POLL_INTERVAL = 0.01
+# Коэффициент XFetch: больше единицы - обновление начинается раньше.
+BETA = 1.0
+STALE_TIMEOUT = 24 * 60 * 60
+
+
+class LocalLRU:
+    """Потокобезопасный LRU по числу записей."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = settings.TIERED_CACHE_LOCAL_ENTRIES
+        if size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local = LocalLRU()
+
+
+def _lock_key(key):
+    return f'tiered:lock:{key}'
+
+
+def _refresh_early(expires, build_seconds):
+    if expires is None:
+        return False
+    # -log(random) в среднем 1, изредка много больше.
+    return (time.time() - build_seconds * BETA * math.log(random.random())
+            >= expires)
+
+
+def _build(key, build, timeout, stale_key, cacheable):
+    started = time.perf_counter()
+    value = build()
+    build_seconds = time.perf_counter() - started
+    if cacheable is not None and not cacheable():
+        return value
+    timeout = cache.get_backend_timeout(timeout)
+    expires = None if timeout is None else time.time() + timeout
+    entry = (value, expires, build_seconds)
+    cache.set(key, entry, timeout)
+    if stale_key is not None:
+        cache.set(stale_key, value, STALE_TIMEOUT)
+    local.set(key, entry)
+    return value
+
+
+def mark_stale(request):
+    """Помечает запрос: в ответ попало прошлое или неполное значение."""
+    if request is not None:
+        request.served_stale = served_stale(request) + 1
+
+
+def served_stale(request):
+    """Сколько раз запрос помечен mark_stale(); 0 - ни разу."""
+    return getattr(request, 'served_stale', 0)
+
+
+def get_or_build(key, build, timeout=None, stale_key=None, on_stale=None,
+                 cacheable=None):
+    """Значение ключа; при промахе его собирает build() в одном процессе.
+
+    stale_key - ключ без поколения: под ним лежит последнее собранное
+    значение, его получают запросы, пока другой процесс пересобирает.
+    Тогда вызывается on_stale(). cacheable() вызывается после сборки:
+    False - значение отдаётся, но не сохраняется.
+    """
+    entry = local.get(key) or cache.get(key)
+    if entry is not None:
+        value, expires, build_seconds = entry
+        local.set(key, entry)
+        if (_refresh_early(expires, build_seconds)
+                and cache.add(_lock_key(key), True, LOCK_TIMEOUT)):
+            try:
+                return _build(key, build, timeout, stale_key, cacheable)
+            finally:
+                cache.delete(_lock_key(key))
+        return value
+    if cache.add(_lock_key(key), True, LOCK_TIMEOUT):
+        try:
+            return _build(key, build, timeout, stale_key, cacheable)
+        finally:
+            cache.delete(_lock_key(key))
+    stale = None if stale_key is None else cache.get(stale_key)
+    if stale is not None:
+        if on_stale is not None:
+            on_stale()
+        return stale
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            local.set(key, entry)
+            return entry[0]
+    # Сборщик завис или упал: собираем сами, не дожидаясь блокировки.
+    return _build(key, build, timeout, stale_key, cacheable)
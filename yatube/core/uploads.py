@@ -0,0 +1,108 @@
+"""Загрузка картинок с ограниченным расходом памяти.
+
+Обработчик загрузки всегда пишет файл на диск, а не в память, и
+перестаёт принимать данные после IMAGE_UPLOAD_MAX_BYTES. prepare_image
+смотрит только заголовок картинки: размеры, число каналов, защиту от
+«бомб». Декодирование нужно лишь для уменьшения слишком больших
+оригиналов, и JPEG при этом сразу декодируется в уменьшенном масштабе
+(draft), так что буфер пикселей не превышает IMAGE_UPLOAD_MEMORY_LIMIT.
+"""
+import os
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+MEGABYTE = 1024 * 1024
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, но не больше лимита.
+
+    Лишние байты отбрасываются, а файл помечается too_large, чтобы форма
+    показала понятную ошибку, а не обрезанную картинку.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.file.too_large = True
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+
+def decoded_size(image):
+    """Сколько байт займут пиксели картинки после декодирования."""
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+def _open(upload):
+    if hasattr(upload, 'temporary_file_path'):
+        return Image.open(upload.temporary_file_path())
+    upload.seek(0)
+    return Image.open(upload)
+
+
+def _downscale(upload, image):
+    side = settings.IMAGE_MAX_SIDE
+    width, height = image.size
+    scale = side / max(width, height)
+    # JPEG декодируется сразу в 1/2, 1/4 или 1/8 размера, не меньше
+    # нужного; для других форматов draft ничего не делает.
+    image.draft('RGB', (round(width * scale), round(height * scale)))
+    if decoded_size(image) > settings.IMAGE_UPLOAD_MEMORY_LIMIT:
+        raise ValidationError(
+            'Картинка слишком большая для обработки, уменьшите её.',
+            code='image_too_large')
+    image_format = 'JPEG' if image.format == 'JPEG' else 'PNG'
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((side, side), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    name = os.path.splitext(upload.name)[0] + (
+        '.jpg' if image_format == 'JPEG' else '.png')
+    # Безымянный временный файл: хранилище скопирует его по частям, а
+    # система удалит при закрытии.
+    file = tempfile.TemporaryFile()
+    image.save(file, image_format, quality=90, optimize=True)
+    size = file.tell()
+    file.seek(0)
+    return UploadedFile(file, name, Image.MIME[image_format], size)
+
+
+def prepare_image(upload):
+    """Проверяет загруженную картинку и уменьшает слишком большую.
+
+    Возвращает файл для сохранения: исходный или уменьшенную копию.
+    """
+    if getattr(upload, 'too_large', False):
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            params={'limit': settings.IMAGE_UPLOAD_MAX_BYTES // MEGABYTE},
+            code='file_too_large')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            image = _open(upload)
+        except (Image.DecompressionBombWarning,
+                Image.DecompressionBombError) as error:
+            raise ValidationError('Слишком много пикселей в картинке.',
+                                  code='decompression_bomb') from error
+    with image:
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise ValidationError('Слишком много пикселей в картинке.',
+                                  code='decompression_bomb')
+        if max(width, height) > settings.IMAGE_MAX_SIDE:
+            return _downscale(upload, image)
+    upload.seek(0)
+    return upload
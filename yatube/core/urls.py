@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('metrics/', views.performance_metrics, name='metrics'),
+]
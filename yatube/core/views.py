@@ -1,7 +1,12 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import metrics
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html',
@@ -16,3 +21,13 @@ def server_error(request):
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html',
                   status=HTTPStatus.FORBIDDEN)
+
+
+@staff_member_required
+def performance_metrics(request):
+    """Гистограммы замеров по адресам с момента запуска процесса."""
+    return JsonResponse({
+        'sample_rate': getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0),
+        'views': metrics.snapshot(),
+        'caches': metrics.lookups(),
+    }, json_dumps_params={'ensure_ascii': False})
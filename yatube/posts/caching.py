@@ -0,0 +1,104 @@
+"""Счётчики поколений для кэша.
+
+У каждой области данных (вся лента, группа, автор, пост, лента подписок
+читателя) есть счётчик поколения в кэше. Сигналы моделей увеличивают
+счётчики затронутых областей, а ключи кэша включают их текущие значения.
+Поэтому записи можно хранить без срока жизни: после изменения данных
+старые ключи просто перестают запрашиваться и вытесняются кэшем.
+
+Внутри транзакции поколение увеличивается дважды: сразу и после коммита.
+Параллельный запрос мог увидеть первое новое поколение раньше коммита,
+прочитать старые строки и сохранить их под этим поколением; второе
+увеличение делает такую запись ненужной.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL = 'global'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def feed_scope(user_id):
+    return f'feed:{user_id}'
+
+
+def _key(scope):
+    return f'generation:{scope}'
+
+
+def _fresh():
+    # Потерянный счётчик начинаем с текущего времени, а не с единицы,
+    # чтобы не совпасть с поколением, под которым ещё лежат старые записи.
+    return int(time.time() * 1000)
+
+
+def generations(*scopes):
+    """Текущие поколения областей одним запросом к кэшу."""
+    keys = {_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, _fresh(), None)
+        found[key] = cache.get(key)
+    return {scope: found[key] for key, scope in keys.items()}
+
+
+def version(*scopes):
+    """Строка поколений для ключа фрагмента или запроса."""
+    current = generations(*scopes)
+    return '.'.join(str(current[scope]) for scope in scopes)
+
+
+def page_version(request, *scopes):
+    """version() для страницы; поколения запоминаются на запросе.
+
+    По ним кэш страниц для гостей потом проверяет, не устарела ли
+    сохранённая страница. Читать их нужно до данных страницы.
+    """
+    current = generations(*scopes)
+    request.page_generations = current
+    return '.'.join(str(current[scope]) for scope in scopes)
+
+
+def _incr(scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.add(_key(scope), _fresh(), None)
+
+
+def bump(*scopes):
+    """Начинает новое поколение у каждой из областей.
+
+    В транзакции поколение увеличивается ещё раз после коммита.
+    """
+    _incr(scopes)
+    if scopes and transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr(scopes))
+
+
+def post_scopes(post):
+    scopes = [GLOBAL, author_scope(post.author_id), post_scope(post.pk)]
+    if post.group_id:
+        scopes.append(group_scope(post.group_id))
+    return scopes
+
+
+def page_key(request):
+    """Позиция страницы в ленте для ключа кэша: курсор или номер."""
+    if 'cursor' in request.GET or 'page' not in request.GET:
+        return 'cursor:' + request.GET.get('cursor', '')
+    return 'page:' + request.GET['page']
@@ -0,0 +1,93 @@
+"""ETag страниц постов для условных GET.
+
+ETag собирается из поколений кэша (см. caching): они меняются с любым
+изменением постов, комментариев и подписок в своей области, а читаются
+одним get_many из кэша. Из базы берётся только то, чего в поколениях
+нет, - один запрос по индексу. В ETag входит и читатель: в шапке его
+имя, на странице автора - подписан ли он.
+
+Last-Modified не отдаём: дата последнего поста не меняется при правке и
+удалении, поэтому не годится как валидатор.
+
+Если в тело попал прошлый фрагмент (его отдают, пока новый собирает
+другой процесс) или заглушка миниатюры, ETag новых поколений у ответа
+снимается: иначе клиент подтверждал бы старую страницу ответом 304 до
+следующего изменения.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from core import tiered
+
+from . import caching, feed
+from .models import Follow, Group, Post
+
+
+def etag(etag_func):
+    """condition(etag_func=...), но без ETag у тела из прошлого фрагмента."""
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if tiered.served_stale(request):
+                del response['ETag']
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(request, *parts):
+    reader = (request.user.username if request.user.is_authenticated
+              else '')
+    raw = '|'.join(str(part) for part in (reader, *parts))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def index(request):
+    return _etag(request, 'index', caching.version(caching.GLOBAL))
+
+
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        'pk', 'title', 'description').first()
+    if group is None:
+        return None
+    return _etag(request, 'group', *group,
+                 caching.version(caching.group_scope(group[0])))
+
+
+def profile(request, username):
+    authors = User.objects.filter(username=username)
+    fields = ['pk', 'first_name', 'last_name']
+    if request.user.is_authenticated:
+        authors = authors.annotate(is_following=Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef('pk'))))
+        fields.append('is_following')
+    author = authors.values_list(*fields).first()
+    if author is None:
+        return None
+    return _etag(request, 'profile', *author,
+                 caching.version(caching.author_scope(author[0])))
+
+
+def post_detail(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        return None
+    # Число постов автора меняется с поколением автора.
+    return _etag(request, 'post', post_id, caching.version(
+        caching.post_scope(post_id), caching.author_scope(author_id)))
+
+
+def follow_index(request):
+    return _etag(request, 'follow',
+                 feed.page_cache_key(request.user, caching.page_key(request)))
@@ -0,0 +1,67 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарным UPDATE ... SET value = value + delta из
+сигналов моделей, в той же транзакции, что и сама запись. Отсутствующий
+счётчик пересчитывается из исходной таблицы при первом обращении, а
+расхождения чинит команда reconcile_counters.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Comment, Counter, Follow, Post
+
+# Откуда пересчитывается каждый счётчик: модель и поле-владелец.
+SOURCES = {
+    Counter.AUTHOR_POSTS: (Post, 'author_id'),
+    Counter.GROUP_POSTS: (Post, 'group_id'),
+    Counter.POST_COMMENTS: (Comment, 'post_id'),
+    Counter.FOLLOWERS: (Follow, 'author_id'),
+    Counter.FOLLOWING: (Follow, 'user_id'),
+}
+
+
+def recount(kind, object_id):
+    model, field = SOURCES[kind]
+    return model.objects.filter(**{field: object_id}).count()
+
+
+def actual_values(kind):
+    """Настоящие значения счётчиков вида одним агрегирующим запросом."""
+    model, field = SOURCES[kind]
+    return dict(
+        model.objects.filter(**{f'{field}__isnull': False})
+        .values(field).annotate(total=Count('pk')).order_by()
+        .values_list(field, 'total')
+    )
+
+
+def _create(kind, object_id):
+    try:
+        with transaction.atomic():
+            return Counter.objects.create(
+                kind=kind, object_id=object_id,
+                value=recount(kind, object_id)).value
+    except IntegrityError:
+        # Счётчик успел создать параллельный запрос.
+        return Counter.objects.get(kind=kind, object_id=object_id).value
+
+
+def get(kind, object_id):
+    value = Counter.objects.filter(
+        kind=kind, object_id=object_id).values_list('value', flat=True)
+    value = value.first()
+    if value is None:
+        return _create(kind, object_id)
+    return value
+
+
+def change(kind, object_id, delta):
+    updated = Counter.objects.filter(kind=kind, object_id=object_id).update(
+        value=F('value') + delta)
+    if not updated:
+        # Пересчёт уже учитывает изменение, ради которого нас позвали.
+        _create(kind, object_id)
+
+
+def forget(kind, object_id):
+    Counter.objects.filter(kind=kind, object_id=object_id).delete()
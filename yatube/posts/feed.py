@@ -0,0 +1,317 @@
+"""Лента подписок: гибрид записи при публикации и чтения при просмотре.
+
+Посты обычных авторов раскладываются по лентам подписчиков в момент
+публикации (push). У популярных авторов, у которых подписчиков не меньше
+FEED_CELEBRITY_THRESHOLD, раскладывать пост по сотням тысяч лент слишком
+дорого, поэтому их свежие посты хранятся в кэше одним списком на автора
+и подмешиваются в ленту при чтении (pull) слиянием куч.
+
+Автор, чей пост хоть раз не разложен по лентам, отмечается (Celebrity)
+и остаётся популярным, пока команда demote_celebrities не разложит его
+посты по лентам подписчиков. Она делает это вне запросов, пачками и
+только когда подписчиков стало меньше FEED_CELEBRITY_DEMOTE_THRESHOLD:
+автор на границе порога не раскладывается заново при каждой отписке.
+
+Готовые страницы ленты кэшируются для каждого читателя. Ключ включает
+поколение ленты читателя и поколения подмешиваемых авторов, поэтому
+подписка, отписка, любые изменения постов авторов, смена имени автора
+или названия группы сразу дают новый ключ.
+"""
+import heapq
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.db import transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from core import metrics, tiered
+
+from . import caching, counters
+from .models import Celebrity, Counter, Follow, Post, Timeline
+from .paginator import NEXT, CountedPaginator, CursorPaginator
+
+FeedEntry = namedtuple('FeedEntry', ('pub_date', 'post_id'))
+CURSOR_FIELDS = ('is_cursor', 'next_cursor', 'previous_cursor')
+
+
+def recent_key(author_id):
+    return f'feed:recent:{author_id}'
+
+
+def is_celebrity(author_id):
+    if Celebrity.objects.filter(author_id=author_id).exists():
+        return True
+    followers = counters.get(Counter.FOLLOWERS, author_id)
+    return followers >= settings.FEED_CELEBRITY_THRESHOLD
+
+
+def celebrity_ids(user):
+    """Популярные авторы среди подписок читателя - их посты тянем сами.
+
+    Запоминается на объекте читателя: в запросе список нужен и для ETag,
+    и для ключа кэша, и для самой ленты.
+    """
+    if not hasattr(user, '_celebrity_ids'):
+        followed = Follow.objects.filter(user=user).values('author_id')
+        user._celebrity_ids = list(Counter.objects.filter(
+            Q(value__gte=settings.FEED_CELEBRITY_THRESHOLD)
+            | Q(object_id__in=Celebrity.objects.values('author_id')),
+            kind=Counter.FOLLOWERS,
+            object_id__in=followed,
+        ).values_list('object_id', flat=True))
+    return user._celebrity_ids
+
+
+def recent_posts(author_id):
+    """Последние посты автора из кэша, при промахе - из базы."""
+    entries = cache.get(recent_key(author_id))
+    if entries is None:
+        entries = [
+            FeedEntry(*row) for row in
+            Post.objects.filter(author_id=author_id).values_list(
+                'pub_date', 'pk')[:settings.FEED_RECENT_SIZE]
+        ]
+        cache.set(recent_key(author_id), entries, None)
+    return entries
+
+
+def push_post(post):
+    """Кладёт новый пост в ленты подписчиков или в кэш популярного автора."""
+    if is_celebrity(post.author_id):
+        # Пост не попал в ленты: автор остаётся популярным до demote().
+        Celebrity.objects.get_or_create(author_id=post.author_id)
+        # Список не дописываем: get и set двух параллельных публикаций
+        # теряли бы одну из них. Сброшенный список соберётся из базы.
+        forget_recent(post.author_id)
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    Timeline.objects.bulk_create(
+        [Timeline(user_id=user_id,
+                  post_id=post.pk,
+                  author_id=post.author_id,
+                  pub_date=post.pub_date)
+         for user_id in follower_ids],
+        ignore_conflicts=True,
+    )
+
+
+def feed_scopes(post):
+    """Области лент подписчиков, куда пост попал при записи.
+
+    Ленты с популярным автором зависят от поколения самого автора.
+    """
+    return authors_feed_scopes([post.author_id])
+
+
+def authors_feed_scopes(author_ids):
+    """Области лент, куда посты авторов попали при записи."""
+    pushed = [author_id for author_id in author_ids
+              if not is_celebrity(author_id)]
+    if not pushed:
+        return []
+    follower_ids = Follow.objects.filter(
+        author_id__in=pushed).values_list(
+        'user_id', flat=True).order_by().distinct()
+    return [caching.feed_scope(user_id) for user_id in follower_ids]
+
+
+def bump_feeds(post):
+    """Новое поколение лент подписчиков автора поста."""
+    caching.bump(*feed_scopes(post))
+
+
+def forget_recent(author_id):
+    """Сбрасывает кэш свежих постов автора.
+
+    Сбрасываем и сразу, и после коммита: список, собранный параллельным
+    запросом до коммита, не увидел бы изменения.
+    """
+    key = recent_key(author_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def forget_post(post):
+    """Сбрасывает кэш свежих постов автора после удаления поста."""
+    forget_recent(post.author_id)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя последние посты нового автора."""
+    if is_celebrity(author_id):
+        return
+    recent = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    Timeline.objects.bulk_create(
+        [Timeline(user_id=user_id,
+                  post_id=post_id,
+                  author_id=author_id,
+                  pub_date=pub_date)
+         for post_id, pub_date in recent],
+        ignore_conflicts=True,
+    )
+
+
+def demote(author_id, chunk_size=500):
+    """Возвращает популярного автора к раскладке постов по лентам.
+
+    Отметка снимается сразу: новые посты и подписки дальше идут обычным
+    путём. Последние посты автора, которые раньше в ленты не писались,
+    раскладываются по лентам подписчиков пачками, каждая в своей
+    транзакции и с новым поколением лент. Возвращает число подписчиков.
+    """
+    Celebrity.objects.filter(author_id=author_id).delete()
+    forget_recent(author_id)
+    recent = list(Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:settings.FEED_BACKFILL_SIZE])
+    followers = Follow.objects.filter(author_id=author_id).order_by(
+        'user_id').values_list('user_id', flat=True)
+    last_id = done = 0
+    while True:
+        user_ids = list(followers.filter(user_id__gt=last_id)[:chunk_size])
+        if not user_ids:
+            return done
+        with transaction.atomic():
+            Timeline.objects.bulk_create(
+                [Timeline(user_id=user_id,
+                          post_id=post_id,
+                          author_id=author_id,
+                          pub_date=pub_date)
+                 for user_id in user_ids
+                 for post_id, pub_date in recent],
+                ignore_conflicts=True,
+            )
+            caching.bump(*(caching.feed_scope(user_id)
+                           for user_id in user_ids))
+        last_id = user_ids[-1]
+        done += len(user_ids)
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты читателя все посты автора после отписки."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def timeline_rows(user):
+    """Строки ленты читателя; страница ленты - один проход по индексу."""
+    return Timeline.objects.filter(user=user).values_list(
+        'pub_date', 'post_id', named=True)
+
+
+def posts_for_rows(rows):
+    """Посты для страницы строк ленты в порядке ленты."""
+    post_ids = [row.post_id for row in rows]
+    posts = Post.objects.cards().in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+def _entry_key(entry):
+    return entry.pub_date, entry.post_id
+
+
+def _beyond(entry, position):
+    direction, pub_date, pk = position
+    if direction == NEXT:
+        return _entry_key(entry) < (pub_date, pk)
+    return _entry_key(entry) > (pub_date, pk)
+
+
+class FeedPaginator(CursorPaginator):
+    """Курсорная лента: строки Timeline плюс посты популярных авторов."""
+
+    def __init__(self, user, per_page, **kwargs):
+        super().__init__(timeline_rows(user), per_page,
+                         pk_field='post_id', **kwargs)
+        self.user = user
+
+    @cached_property
+    def pulled_authors(self):
+        return celebrity_ids(self.user)
+
+    def _author_rows(self, author_id, position, limit):
+        recent = recent_posts(author_id)
+        forward = position is None or position[0] == NEXT
+        entries = recent
+        if position is not None:
+            entries = [entry for entry in recent
+                       if _beyond(entry, position)]
+        if not forward:
+            entries.reverse()
+        cache_is_full = len(recent) >= settings.FEED_RECENT_SIZE
+        if len(entries) >= limit or not cache_is_full or (
+                not forward and len(entries) < len(recent)):
+            return entries[:limit]
+        # Кэш исчерпан: глубже списка свежих постов идём в базу.
+        posts = Post.objects.filter(author_id=author_id).values_list(
+            'pub_date', 'id')
+        return [FeedEntry(*row) for row in
+                CursorPaginator(posts, limit)._rows(position, limit)]
+
+    def _rows(self, position, limit):
+        streams = [super()._rows(position, limit)]
+        streams.extend(self._author_rows(author_id, position, limit)
+                       for author_id in self.pulled_authors)
+        forward = position is None or position[0] == NEXT
+        merged = heapq.merge(*streams, key=_entry_key, reverse=forward)
+        seen = set()
+        unique = (entry for entry in merged
+                  if not (entry.post_id in seen or seen.add(entry.post_id)))
+        return list(islice(unique, limit))
+
+    def get_cursor_page(self, cursor):
+        page = super().get_cursor_page(cursor)
+        page.object_list = posts_for_rows(page.object_list)
+        return page
+
+
+def page_cache_key(user, page_key):
+    """Ключ страницы ленты читателя для позиции page_key."""
+    scopes = [caching.feed_scope(user.pk)]
+    scopes.extend(caching.author_scope(author_id)
+                  for author_id in celebrity_ids(user))
+    return f'feed:page:{user.pk}:{caching.version(*scopes)}:{page_key}'
+
+
+def cached_page(user, page_key, build_page, per_page):
+    """Страница ленты из кэша; при промахе её строит build_page().
+
+    Попадания и промахи идут в метрики.
+    """
+    built = []
+
+    def build():
+        page = build_page()
+        built.append(page)
+        return page_state(page)
+
+    state = tiered.get_or_build(page_cache_key(user, page_key), build,
+                                settings.FEED_PAGE_CACHE_TIMEOUT)
+    metrics.count_lookup('follow_page', not built)
+    if built:
+        return built[0]
+    # Паджинатор нужен шаблону только для номеров страниц и берёт их
+    # из сохранённого числа постов, не из базы.
+    paginator = CountedPaginator(Post.objects.none(), per_page,
+                                 count=state['count'])
+    page = Page(state['posts'], state['number'], paginator)
+    for field in CURSOR_FIELDS:
+        if field in state:
+            setattr(page, field, state[field])
+    return page
+
+
+def page_state(page):
+    """Страница без паджинатора и его запроса - её можно класть в кэш."""
+    state = {'posts': list(page.object_list), 'number': page.number}
+    if getattr(page, 'is_cursor', False):
+        state['count'] = 0
+        state.update({field: getattr(page, field)
+                      for field in CURSOR_FIELDS})
+    else:
+        state['count'] = page.paginator.count
+    return state
@@ -1,4 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from core.uploads import prepare_image
+
 from .models import Post, Comment
 
 
@@ -14,6 +18,12 @@ class PostForm(forms.ModelForm):
                       'image': 'Изображение'}
         fields = ['text', 'group', 'image']
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return prepare_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
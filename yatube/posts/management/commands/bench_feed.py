@@ -0,0 +1,99 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.metrics import percentile
+from posts import feed
+from posts.models import Follow, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает p50/p99 чтения ленты подписок для читателя многих '
+            'авторов и читателя популярных авторов. Данные создаются в '
+            'транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=200)
+        parser.add_argument('--celebrities', type=int, default=5)
+        parser.add_argument('--fans', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=20,
+                            help='постов на каждого автора')
+        parser.add_argument('--samples', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            readers = self.seed(options)
+            self.report(readers, options['samples'])
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        prefix = f'bench{int(time.time())}'
+        User.objects.bulk_create(
+            User(username=f'{prefix}_{i}')
+            for i in range(options['authors'] + options['celebrities']
+                           + options['fans'] + 2))
+        # SQLite не возвращает id из bulk_create, перечитываем пользователей.
+        users = list(User.objects.filter(
+            username__startswith=f'{prefix}_').order_by('pk'))
+        many_reader, star_reader = users[:2]
+        authors = users[2:2 + options['authors']]
+        stars = users[2 + options['authors']:
+                      2 + options['authors'] + options['celebrities']]
+        fans = users[2 + options['authors'] + options['celebrities']:]
+        Post.objects.bulk_create(
+            Post(author=author, text=f'пост {i}')
+            for author in authors + stars
+            for i in range(options['posts']))
+        Follow.objects.bulk_create(
+            [Follow(user=many_reader, author=author) for author in authors]
+            + [Follow(user=star_reader, author=star) for star in stars]
+            + [Follow(user=fan, author=star)
+               for fan in fans for star in stars])
+        for author in authors:
+            feed.backfill(many_reader.pk, author.pk)
+        for star in stars:
+            cache.delete(feed.recent_key(star.pk))
+        self.stars = stars
+        self.fans = options['fans']
+        return {'многие авторы': many_reader,
+                'популярные авторы': star_reader}
+
+    def measure(self, reader, samples):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            paginator = feed.FeedPaginator(reader, 10)
+            list(paginator.get_cursor_page(None))
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, readers, samples):
+        strategies = {
+            'гибрид': self.fans,
+            'только push': 10 ** 9,
+        }
+        for strategy, threshold in strategies.items():
+            with override_settings(FEED_CELEBRITY_THRESHOLD=threshold):
+                if strategy == 'только push':
+                    for star in self.stars:
+                        feed.demote(star.pk)
+                started = time.perf_counter()
+                Post.objects.create(author=self.stars[0], text='новый пост')
+                publish = (time.perf_counter() - started) * 1000
+                self.stdout.write(
+                    f'{strategy}: публикация популярного автора '
+                    f'{publish:.1f} мс')
+                for name, reader in readers.items():
+                    timings = self.measure(reader, samples)
+                    self.stdout.write(
+                        f'  читатель ({name}): '
+                        f'p50 {percentile(timings, 0.5):.2f} мс, '
+                        f'p99 {percentile(timings, 0.99):.2f} мс')
+        for star in self.stars:
+            cache.delete(feed.recent_key(star.pk))
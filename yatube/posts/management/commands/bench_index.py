@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from posts import caching, views
+from posts.models import Post
+
+User = get_user_model()
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Время отрисовки главной страницы при разном числе постов. '
+            'Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1000, 10000, 100000],
+                            help='число постов, например 1000 1000000')
+        parser.add_argument('--samples', type=int, default=30)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = User.objects.create(
+                username=f'bench_index_{int(time.time())}')
+            total = Post.objects.count()
+            for size in sorted(options['sizes']):
+                while total < size:
+                    batch = min(BATCH_SIZE, size - total)
+                    Post.objects.bulk_create(
+                        Post(author=author, text=f'пост {total + i}')
+                        for i in range(batch))
+                    total += batch
+                miss, hit = self.measure(options['samples'])
+                self.stdout.write(
+                    f'{total:>9} постов: промах кэша {miss:.2f} мс, '
+                    f'попадание {hit:.2f} мс')
+            transaction.set_rollback(True)
+        caching.bump(caching.GLOBAL)
+
+    def render(self, request):
+        started = time.perf_counter()
+        views.index(request)
+        return (time.perf_counter() - started) * 1000
+
+    def measure(self, samples):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        misses = []
+        hits = []
+        for _ in range(samples):
+            caching.bump(caching.GLOBAL)
+            misses.append(self.render(request))
+            hits.append(self.render(request))
+        return statistics.median(misses), statistics.median(hits)
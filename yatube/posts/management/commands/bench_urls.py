@@ -0,0 +1,154 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from core import tiered
+from core.metrics import percentile
+from posts import urls as posts_urls
+from posts.models import Counter, Group, Post
+from users import urls as users_urls
+
+User = get_user_model()
+URL_MODULES = (posts_urls, users_urls)
+# Откат транзакции не откатывает кэш: поколения, фрагменты и страницы,
+# собранные из откатываемых данных, пишем в отдельный кэш процесса.
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-urls',
+    }
+}
+
+
+def top_object_id(kind):
+    return Counter.objects.filter(kind=kind).order_by(
+        '-value').values_list('object_id', flat=True).first()
+
+
+def body(response):
+    """Тело ответа; потоковый ответ с диска читается и закрывается."""
+    if not response.streaming:
+        return response.content
+    content = b''.join(response.streaming_content)
+    response.close()
+    return content
+
+
+class Command(BaseCommand):
+    help = ('Обходит все адреса posts и users тестовым клиентом и пишет '
+            'перцентили времени, число запросов и размер ответа в JSON. '
+            'Изменения в базе откатываются, кэш на время замера свой.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=50)
+        parser.add_argument('--output', help='файл для JSON-отчёта')
+        parser.add_argument('--cold', action='store_true',
+                            help='очищать кэш перед каждым запросом')
+
+    def handle(self, *args, **options):
+        if options['samples'] < 1:
+            raise CommandError('--samples должно быть больше нуля')
+        isolated_cache = override_settings(CACHES=BENCH_CACHES,
+                                           TIERED_CACHE_LOCAL_ENTRIES=0)
+        with isolated_cache, transaction.atomic():
+            tiered.local.clear()
+            routes = self.routes()
+            results = {name: self.measure(url, options)
+                       for name, url in routes}
+            transaction.set_rollback(True)
+        report = {
+            'posts': Post.objects.count(),
+            'samples': options['samples'],
+            'cold': options['cold'],
+            'routes': results,
+        }
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<32} {result["status"]} '
+                f'p50 {result["p50_ms"]:>8.2f} '
+                f'p95 {result["p95_ms"]:>8.2f} '
+                f'p99 {result["p99_ms"]:>8.2f} мс, '
+                f'запросов {result["queries"]:>3}, '
+                f'байт {result["bytes"]}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+                file.write('\n')
+
+    def sample_kwargs(self):
+        """Значения параметров адресов: самые нагруженные объекты."""
+        self.reader = User.objects.filter(
+            pk=top_object_id(Counter.FOLLOWING)).first() or (
+            User.objects.order_by('pk').first())
+        if self.reader is None:
+            raise CommandError('База пуста: сначала запустите seed_data')
+        author = User.objects.filter(
+            pk=top_object_id(Counter.FOLLOWERS)).first() or self.reader
+        group = Group.objects.filter(
+            pk=top_object_id(Counter.GROUP_POSTS)).first() or (
+            Group.objects.first())
+        post = Post.objects.filter(
+            pk=top_object_id(Counter.POST_COMMENTS)).first() or (
+            Post.objects.first())
+        return {
+            'slug': group.slug if group else None,
+            'username': author.username,
+            'post_id': post.pk if post else None,
+            'preset': 'preview',
+            'extension': 'jpg',
+            'uid64': 'MQ',
+            'token': 'set-password',
+        }
+
+    def routes(self):
+        values = self.sample_kwargs()
+        # Картинке поста нужен пост с картинкой, а не самый обсуждаемый.
+        image_post_id = Post.objects.exclude(image='').order_by(
+            '-pk').values_list('pk', flat=True).first()
+        overrides = {'posts:post_image': {'post_id': image_post_id}}
+        routes = []
+        for module in URL_MODULES:
+            for pattern in module.urlpatterns:
+                name = f'{module.app_name}:{pattern.name}'
+                route_values = dict(values, **overrides.get(name, {}))
+                kwargs = {key: route_values.get(key)
+                          for key in pattern.pattern.converters}
+                if None in kwargs.values():
+                    self.stderr.write(f'{name}: нет данных, пропущен')
+                    continue
+                routes.append((name, reverse(name, kwargs=kwargs)))
+        return routes
+
+    def measure(self, url, options):
+        client = Client()
+        client.force_login(self.reader)
+        # Первый запрос прогревает импорты и кэш шаблонов.
+        body(client.get(url))
+        timings = []
+        for _ in range(options['samples']):
+            if '_auth_user_id' not in client.session:
+                # Выход разлогинивает клиента, возвращаем сессию.
+                client.force_login(self.reader)
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                content = body(response)
+                timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 0.50), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'queries': len(queries),
+            'bytes': len(content),
+        }
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import counters, feed
+from posts.models import Celebrity, Counter
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает по лентам посты авторов, у которых подписчиков '
+            'стало меньше FEED_CELEBRITY_DEMOTE_THRESHOLD. Запускается по '
+            'расписанию, а не из запросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='подписчиков в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, кого пора вернуть')
+
+    def handle(self, *args, **options):
+        author_ids = Celebrity.objects.values_list('author_id', flat=True)
+        for author_id in list(author_ids):
+            followers = counters.get(Counter.FOLLOWERS, author_id)
+            if followers >= settings.FEED_CELEBRITY_DEMOTE_THRESHOLD:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'автор {author_id}: {followers} '
+                                  f'подписчиков')
+                continue
+            done = feed.demote(author_id, options['chunk_size'])
+            self.stdout.write(f'автор {author_id}: посты разложены по '
+                              f'{done} лентам')
@@ -0,0 +1,159 @@
+import hashlib
+import math
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import StoredFile
+from posts import thumbnails
+from posts.models import Post
+
+CHUNK_SIZE = 5000
+
+
+class BloomFilter:
+    """Множество с ложноположительными ответами и без ложноотрицательных.
+
+    Сирота может ошибочно показаться используемым и остаться на диске,
+    но используемый файл никогда не будет удалён.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2),
+                   8)
+        self.size = bits
+        self.hashes = max(round(bits / capacity * math.log(2)), 1)
+        self.bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode()).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return ((first + i * second) % self.size
+                for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+def scan(path):
+    """Файлы под каталогом через os.scandir, без списка в памяти."""
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки, на которые не ссылается ни '
+            'один пост, и их миниатюры.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только посчитать сирот')
+        parser.add_argument('--quarantine',
+                            help='переносить сирот в этот каталог, '
+                                 'а не удалять')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='не трогать файлы моложе стольких секунд: '
+                                 'их пост может быть ещё не сохранён')
+        parser.add_argument('--bloom', type=int, metavar='CAPACITY',
+                            help='хранить имена в фильтре Блума на '
+                                 'CAPACITY элементов вместо множества')
+
+    def handle(self, *args, **options):
+        if options['quarantine'] and options['dry_run']:
+            raise CommandError('--quarantine и --dry-run несовместимы')
+        started = time.perf_counter()
+        referenced = self.referenced(options['bloom'])
+        self.stdout.write(
+            f'Ссылки загружены за {time.perf_counter() - started:.1f} с')
+        self.scanned = self.orphans = self.freed = 0
+        self.removed_thumbnails = []
+        started = time.perf_counter()
+        newest = time.time() - options['min_age']
+        # Только картинки постов и их миниатюры: cache/ - хранилище
+        # sorl-thumbnail, на его файлы ссылается его собственная таблица.
+        root = os.path.join(settings.MEDIA_ROOT, 'posts')
+        for entry in scan(root):
+            self.scanned += 1
+            name = os.path.relpath(entry.path, settings.MEDIA_ROOT)
+            name = name.replace(os.sep, '/')
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > newest or self.is_used(name, referenced):
+                continue
+            self.orphans += 1
+            self.freed += stat.st_size
+            if not options['dry_run']:
+                self.remove(entry.path, name, options['quarantine'])
+        if not options['dry_run']:
+            self.remove_empty_dirs(root)
+        # Отметка готовности пережила бы удалённую миниатюру.
+        thumbnails.unmark(self.removed_thumbnails)
+        elapsed = time.perf_counter() - started
+        verb = 'Найдено' if options['dry_run'] else 'Убрано'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено {self.scanned} файлов за {elapsed:.1f} с '
+            f'({self.scanned / max(elapsed, 1e-6):.0f} файлов/с). '
+            f'{verb} сирот: {self.orphans}, '
+            f'{self.freed / 1024 / 1024:.1f} МБ'))
+
+    def referenced(self, bloom_capacity):
+        """Имена картинок постов и каталоги их миниатюр, пачками."""
+        referenced = (BloomFilter(bloom_capacity) if bloom_capacity
+                      else set())
+        sources = (
+            Post.objects.exclude(image='').values_list('image', flat=True),
+            StoredFile.objects.values_list('name', flat=True),
+        )
+        for queryset in sources:
+            for name in queryset.iterator(chunk_size=CHUNK_SIZE):
+                referenced.add(name)
+                referenced.add(self.variants_dir(name))
+        return referenced
+
+    def variants_dir(self, image_name):
+        return thumbnails.thumbnail_name(image_name).rsplit('/', 1)[0]
+
+    def is_used(self, name, referenced):
+        prefix = thumbnails.THUMBNAIL_DIR + '/'
+        if name.startswith(prefix):
+            return name.rsplit('/', 1)[0] in referenced
+        return name in referenced
+
+    def remove(self, path, name, quarantine):
+        if name.startswith(thumbnails.THUMBNAIL_DIR + '/'):
+            self.removed_thumbnails.append(name)
+        try:
+            if quarantine:
+                target = os.path.join(quarantine, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def remove_empty_dirs(self, root):
+        for directory, _, _ in os.walk(root, topdown=False):
+            if directory != root:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
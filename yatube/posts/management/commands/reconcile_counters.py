@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+from posts.models import Counter
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики постов, комментариев и подписок с таблицами '
+            'и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать расхождения')
+
+    def handle(self, *args, **options):
+        for kind in counters.SOURCES:
+            with transaction.atomic():
+                drift = self.reconcile(kind, options['dry_run'])
+            self.stdout.write(f'{kind}: расхождений {drift}')
+
+    def reconcile(self, kind, dry_run):
+        actual = counters.actual_values(kind)
+        stored = dict(Counter.objects.select_for_update().filter(
+            kind=kind).values_list('object_id', 'value'))
+        wrong = {object_id: actual.get(object_id, 0)
+                 for object_id, value in stored.items()
+                 if actual.get(object_id, 0) != value}
+        missing = {object_id: value for object_id, value in actual.items()
+                   if object_id not in stored}
+        if dry_run:
+            return len(wrong) + len(missing)
+        for object_id, value in wrong.items():
+            Counter.objects.filter(kind=kind, object_id=object_id).update(
+                value=value)
+        Counter.objects.bulk_create(
+            [Counter(kind=kind, object_id=object_id, value=value)
+             for object_id, value in missing.items()])
+        return len(wrong) + len(missing)
@@ -0,0 +1,112 @@
+import json
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts import caching, feed, thumbnails
+from posts.models import Post
+
+DEFAULT_CHECKPOINT = os.path.join(settings.BASE_DIR,
+                                  '.thumbnails-checkpoint.json')
+
+
+class Command(BaseCommand):
+    help = ('Пересоздаёт миниатюры картинок постов пулом процессов. '
+            'Идёт по постам пачками и запоминает, где остановилась.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--force', action='store_true',
+                            help='пересоздать и уже готовые миниатюры')
+        parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT,
+                            help='файл с id последнего обработанного поста')
+        parser.add_argument('--restart', action='store_true',
+                            help='начать с начала, не глядя на checkpoint')
+
+    def handle(self, *args, **options):
+        last_pk = 0 if options['restart'] else self.load_checkpoint(
+            options['checkpoint'])
+        if last_pk:
+            self.stdout.write(f'Продолжаем после поста {last_pk}')
+        self.seen = set()
+        self.done = self.failed = 0
+        started = time.perf_counter()
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(options['workers']) as pool:
+            while True:
+                rows = list(
+                    Post.objects.exclude(image='').filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .values_list('pk', 'image', 'author_id', 'group_id')
+                    [:options['chunk_size']])
+                if not rows:
+                    break
+                self.process_chunk(pool, rows, options['force'])
+                last_pk = rows[-1][0]
+                self.save_checkpoint(options['checkpoint'], last_pk)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'до поста {last_pk}: готово {self.done}, ошибок '
+                    f'{self.failed}, {self.done / elapsed:.1f} картинок/с')
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {self.done} картинок, ошибок {self.failed} за '
+            f'{time.perf_counter() - started:.1f} с'))
+
+    def process_chunk(self, pool, rows, force):
+        jobs = []
+        images = []
+        failed = set()
+        scopes = set()
+        author_ids = set()
+        for pk, image_name, author_id, group_id in rows:
+            post = Post(pk=pk, author_id=author_id, group_id=group_id)
+            scopes.update(caching.post_scopes(post))
+            author_ids.add(author_id)
+            if image_name in self.seen:
+                # Одна картинка у нескольких постов: миниатюры общие.
+                continue
+            self.seen.add(image_name)
+            images.append(image_name)
+            if not force and default_storage.exists(
+                    thumbnails.thumbnail_name(image_name)):
+                continue
+            try:
+                jobs.append((image_name, default_storage.path(image_name),
+                             thumbnails.variant_targets(image_name)))
+            except SuspiciousFileOperation:
+                failed.add(image_name)
+                self.stderr.write(f'{image_name}: путь вне MEDIA_ROOT')
+        for image_name, error in pool.imap_unordered(
+                thumbnails.render_job, jobs):
+            if error:
+                failed.add(image_name)
+                self.stderr.write(f'{image_name}: {error}')
+        self.done += sum(1 for job in jobs if job[0] not in failed)
+        self.failed += len(failed)
+        thumbnails.mark_ready(name for name in images if name not in failed)
+        # Страницы и ленты подписчиков с заглушками лежат в кэше:
+        # начинаем новое поколение. Ленты зависят только от автора.
+        scopes.update(feed.authors_feed_scopes(author_ids))
+        caching.bump(*scopes)
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)['last_pk']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def save_checkpoint(self, path, last_pk):
+        partial = f'{path}.part'
+        with open(partial, 'w', encoding='utf-8') as file:
+            json.dump({'last_pk': last_pk}, file)
+        os.replace(partial, path)
@@ -0,0 +1,163 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import caching, feed
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+BATCH_SIZE = 1000
+
+
+def power_law_weights(count, alpha):
+    """Веса по закону Ципфа: первый объект в разы популярнее сотого."""
+    return [1 / (rank ** alpha) for rank in range(1, count + 1)]
+
+
+@contextmanager
+def keep_pub_date(*models):
+    """Отключает auto_now_add, чтобы записать исторические даты."""
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу правдоподобными данными: подписчики по '
+            'степенному закону, посты сериями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='показатель степенного закона популярности')
+        parser.add_argument('--days', type=int, default=365,
+                            help='за сколько дней разбросать посты')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        if options['seed'] is not None:
+            self.faker.seed_instance(options['seed'])
+        with transaction.atomic():
+            users = self.seed_users(options['users'])
+            groups = self.seed_groups(options['groups'])
+            weights = power_law_weights(len(users), options['alpha'])
+            # Популярность автора не зависит от порядка создания.
+            self.random.shuffle(weights)
+            with keep_pub_date(Post):
+                posts = self.seed_posts(options, users, groups, weights)
+            self.seed_comments(options, users, posts)
+            self.seed_follows(options, users, weights)
+        call_command('reconcile_counters', stdout=self.stdout)
+        caching.bump(caching.GLOBAL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {len(posts)}'))
+
+    def created_ids(self, model, queryset, objects):
+        """Создаёт объекты пачками и возвращает их id.
+
+        SQLite не возвращает id из bulk_create, поэтому берём всё, что
+        появилось после последнего существующего id.
+        """
+        last = queryset.order_by('-pk').values_list('pk', flat=True).first()
+        model.objects.bulk_create(objects)
+        return list(queryset.filter(pk__gt=last or 0).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def seed_users(self, count):
+        suffix = timezone.now().strftime('%H%M%S')
+        users = []
+        for i in range(count):
+            profile = self.faker.simple_profile()
+            users.append(User(
+                username=f'{profile["username"]}_{suffix}_{i}'[:150],
+                first_name=self.faker.first_name(),
+                last_name=self.faker.last_name(),
+                email=profile['mail'],
+                password='!',
+            ))
+        return self.created_ids(User, User.objects.all(), users)
+
+    def seed_groups(self, count):
+        suffix = timezone.now().strftime('%H%M%S')
+        return self.created_ids(Group, Group.objects.all(), [
+            Group(title=self.faker.sentence(nb_words=3)[:200],
+                  slug=f'group-{suffix}-{i}',
+                  description=self.faker.paragraph())
+            for i in range(count)])
+
+    def bursty_dates(self, count, days):
+        """Даты постов сериями: короткие всплески с паузами между ними."""
+        now = timezone.now()
+        dates = []
+        while len(dates) < count:
+            moment = now - timedelta(seconds=self.random.uniform(
+                0, days * 24 * 3600))
+            for _ in range(min(int(self.random.paretovariate(1.5)),
+                               count - len(dates))):
+                dates.append(moment)
+                moment += timedelta(seconds=self.random.expovariate(1 / 90))
+        return [min(date, now) for date in dates]
+
+    def seed_posts(self, options, users, groups, weights):
+        authors = self.random.choices(users, weights, k=options['posts'])
+        posts = []
+        for author_id, pub_date in zip(
+                authors, self.bursty_dates(options['posts'], options['days'])):
+            group_id = None
+            if groups and self.random.random() < 0.5:
+                group_id = self.random.choice(groups)
+            posts.append(Post(author_id=author_id,
+                              group_id=group_id,
+                              text=self.faker.paragraph(nb_sentences=5),
+                              pub_date=pub_date))
+        return self.created_ids(Post, Post.objects.all(), posts)
+
+    def seed_comments(self, options, users, posts):
+        if not posts:
+            return
+        # Обсуждают в основном немногие популярные посты.
+        weights = power_law_weights(len(posts), options['alpha'])
+        self.random.shuffle(weights)
+        commented = self.random.choices(posts, weights,
+                                        k=options['comments'])
+        for start in range(0, len(commented), BATCH_SIZE):
+            Comment.objects.bulk_create([
+                Comment(post_id=post_id,
+                        author_id=self.random.choice(users),
+                        text=self.faker.sentence())
+                for post_id in commented[start:start + BATCH_SIZE]])
+
+    def seed_follows(self, options, users, weights):
+        pairs = set()
+        attempts = options['follows'] * 3
+        while len(pairs) < options['follows'] and attempts:
+            attempts -= 1
+            user_id = self.random.choice(users)
+            author_id = self.random.choices(users, weights)[0]
+            if user_id != author_id:
+                pairs.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            ignore_conflicts=True)
+        for user_id, author_id in pairs:
+            feed.backfill(user_id, author_id)
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Counter = apps.get_model('posts', 'Counter')
+    sources = (
+        ('author_posts', Post, 'author_id'),
+        ('group_posts', Post, 'group_id'),
+        ('post_comments', Comment, 'post_id'),
+        ('followers', Follow, 'author_id'),
+        ('following', Follow, 'user_id'),
+    )
+    rows = []
+    for kind, model, field in sources:
+        totals = (model.objects.filter(**{f'{field}__isnull': False})
+                  .values(field).annotate(total=Count('pk')).order_by()
+                  .values_list(field, 'total'))
+        rows.extend(Counter(kind=kind, object_id=object_id, value=total)
+                    for object_id, total in totals)
+    Counter.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('author_posts', 'Посты автора'), ('group_posts', 'Посты группы'), ('post_comments', 'Комментарии поста'), ('followers', 'Подписчики'), ('following', 'Подписки')], max_length=20, verbose_name='Счётчик')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Объект')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счётчик',
+                'verbose_name_plural': 'Счётчики',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='counter',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_counter'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
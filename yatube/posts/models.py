@@ -24,6 +24,26 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Всё, что выводят карточки поста в лентах и на странице поста.
+    CARD_FIELDS = (
+        'text', 'pub_date', 'image', 'author', 'group',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__slug', 'group__title',
+    )
+
+    def cards(self):
+        """Посты для карточек: автор и группа одним JOIN, без лишних полей."""
+        return self.select_related('author', 'group').only(*self.CARD_FIELDS)
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_list(self):
+        """Комментарии для списка под постом вместе с авторами."""
+        return self.select_related('author').only(
+            'text', 'pub_date', 'post', 'author', 'author__username')
+
+
 class Post(CreatedModel):
     text = models.TextField('Текст поста',
                             help_text='Введите текст поста')
@@ -40,10 +60,22 @@ class Post(CreatedModel):
                               blank=True,
                               help_text='Картинка')
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
-        ordering = ['-pub_date', 'author']
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Каждая лента - фильтр по автору или группе и сортировка по дате,
+        # id в конце индекса даёт порядок курсора без сортировки в памяти.
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -63,10 +95,14 @@ class Comment(CreatedModel):
     text = models.TextField(verbose_name='Комментарий',
                             help_text='Напишите комментарий')
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [models.Index(fields=['post', '-pub_date'],
+                                name='comment_post_date_idx')]
 
 
 class Follow(models.Model):
@@ -83,3 +119,78 @@ class Follow(models.Model):
         verbose_name_plural = 'Лента авторов'
         constraints = [models.UniqueConstraint(
             fields=['user', 'author'], name='unique_members')]
+        # Подписки читателя ищутся по уникальному (user, author),
+        # подписчики автора при рассылке поста - по этому индексу.
+        indexes = [models.Index(fields=['author', 'user'],
+                                name='follow_author_user_idx')]
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост)."""
+    user = models.ForeignKey(User,
+                             related_name='timeline',
+                             on_delete=models.CASCADE,
+                             verbose_name='Читатель')
+    post = models.ForeignKey(Post,
+                             related_name='+',
+                             on_delete=models.CASCADE,
+                             verbose_name='Пост')
+    author = models.ForeignKey(User,
+                               related_name='+',
+                               on_delete=models.CASCADE,
+                               verbose_name='Автор')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'post'], name='unique_timeline_post')]
+        indexes = [models.Index(
+            fields=['user', '-pub_date', '-post'],
+            name='timeline_user_date_idx')]
+
+
+class Celebrity(models.Model):
+    """Популярный автор, чьи посты подмешиваются в ленты при чтении.
+
+    Запись появляется, когда пост автора впервые не разложен по лентам,
+    и снимается только командой demote_celebrities: до этого посты автора
+    читаются из кэша, даже если подписчиков стало меньше порога.
+    """
+    author = models.OneToOneField(User,
+                                  primary_key=True,
+                                  related_name='+',
+                                  on_delete=models.CASCADE,
+                                  verbose_name='Автор')
+
+    class Meta:
+        verbose_name = 'Популярный автор'
+        verbose_name_plural = 'Популярные авторы'
+
+
+class Counter(models.Model):
+    """Поддерживаемые счётчики вместо COUNT(*) на каждом просмотре."""
+    AUTHOR_POSTS = 'author_posts'
+    GROUP_POSTS = 'group_posts'
+    POST_COMMENTS = 'post_comments'
+    FOLLOWERS = 'followers'
+    FOLLOWING = 'following'
+    KINDS = (
+        (AUTHOR_POSTS, 'Посты автора'),
+        (GROUP_POSTS, 'Посты группы'),
+        (POST_COMMENTS, 'Комментарии поста'),
+        (FOLLOWERS, 'Подписчики'),
+        (FOLLOWING, 'Подписки'),
+    )
+
+    kind = models.CharField('Счётчик', max_length=20, choices=KINDS)
+    object_id = models.PositiveIntegerField('Объект')
+    value = models.IntegerField('Значение', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+        constraints = [models.UniqueConstraint(
+            fields=['kind', 'object_id'], name='unique_counter')]
@@ -0,0 +1,111 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, pub_date, pk):
+    """Упаковывает позицию в ленте в непрозрачный токен для ?cursor=."""
+    raw = f'{direction}|{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (направление, pub_date, pk) или None для битого токена."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CountedPaginator(Paginator):
+    """Постраничный вывод по номеру, число объектов берётся из счётчика."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Каждая страница - это один запрос вида
+    WHERE (pub_date, id) < (:pub_date, :id) ORDER BY ... LIMIT per_page + 1,
+    поэтому далёкие страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, object_list, per_page,
+                 date_field='pub_date', pk_field='id', **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.date_field = date_field
+        self.pk_field = pk_field
+
+    def _position(self, obj):
+        return (getattr(obj, self.date_field),
+                getattr(obj, self.pk_field))
+
+    def _seek(self, direction, pub_date, pk):
+        """Строки строго после (NEXT) или строго до (PREVIOUS) позиции."""
+        lookup = 'lt' if direction == NEXT else 'gt'
+        condition = (
+            Q(**{f'{self.date_field}__{lookup}': pub_date})
+            | Q(**{self.date_field: pub_date,
+                   f'{self.pk_field}__{lookup}': pk})
+        )
+        ordering = (self.date_field, self.pk_field)
+        if direction == NEXT:
+            ordering = tuple(f'-{field}' for field in ordering)
+        return self.object_list.filter(condition).order_by(*ordering)
+
+    def _first(self):
+        return self.object_list.order_by(
+            f'-{self.date_field}', f'-{self.pk_field}')
+
+    def _rows(self, position, limit):
+        """Не больше limit строк от позиции в порядке обхода."""
+        queryset = self._seek(*position) if position else self._first()
+        return list(queryset[:limit])
+
+    def get_cursor_page(self, cursor):
+        """Возвращает Page для токена; битый токен ведёт на первую страницу."""
+        return self._cursor_page(cursor)
+
+    def _cursor_page(self, cursor):
+        # Страница строк _rows(): наследники обрабатывают её один раз
+        # в get_cursor_page(), в том числе при возврате к первой странице.
+        position = decode_cursor(cursor)
+        direction = position[0] if position else None
+        rows = self._rows(position, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            if not has_more:
+                # Дошли до начала ленты: показываем полную первую страницу.
+                return self._cursor_page(None)
+            rows.reverse()
+        page = Page(rows, 1, self)
+        page.is_cursor = True
+        page.next_cursor = None
+        page.previous_cursor = None
+        if rows and (has_more or direction == PREVIOUS):
+            page.next_cursor = encode_cursor(
+                NEXT, *self._position(rows[-1]))
+        if rows and direction is not None:
+            page.previous_cursor = encode_cursor(
+                PREVIOUS, *self._position(rows[0]))
+        return page
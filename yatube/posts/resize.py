@@ -0,0 +1,149 @@
+"""Картинки постов нужного размера по запросу.
+
+Размер выбирается из IMAGE_PRESETS, формат - из тех, что умеет Pillow.
+Готовый файл кладётся в дисковый кэш IMAGE_RESIZE_CACHE_DIR и дальше
+отдаётся прямо с диска. Кэш ограничен IMAGE_RESIZE_CACHE_BYTES: давно не
+запрошенные файлы (по времени изменения, которое обновляется при каждом
+попадании) удаляются первыми.
+
+Параллельные запросы одного отсутствующего файла создают его один раз:
+создание идёт под файловой блокировкой, и ждущие находят готовый файл.
+Блокировки общие для групп ключей, поэтому файлов блокировок немного.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from . import thumbnails
+
+LOCK_STRIPES = 64
+
+# Расширение в адресе -> формат Pillow.
+EXTENSIONS = {thumbnails.ENCODINGS[image_format][0]: image_format
+              for image_format in thumbnails.FORMATS}
+EXTENSIONS['png'] = 'PNG'
+
+_written_lock = threading.Lock()
+_written = 0
+
+
+def content_type(extension):
+    return Image.MIME[EXTENSIONS[extension]]
+
+
+def cache_key(image_name, preset, extension):
+    """Ключ не меняется, пока у поста та же картинка."""
+    width, height = settings.IMAGE_PRESETS[preset]
+    return hashlib.sha1(
+        f'{image_name}|{width}x{height}|{extension}'.encode()).hexdigest()
+
+
+def cache_path(key, extension):
+    return os.path.join(settings.IMAGE_RESIZE_CACHE_DIR, key[:2],
+                        f'{key}.{extension}')
+
+
+def render(source_path, target_path, size, image_format):
+    """Обрезка по центру под размер, JPEG декодируется сразу уменьшенным."""
+    with Image.open(source_path) as image:
+        width, height = image.size
+        scale = max(size[0] / width, size[1] / height)
+        if scale < 1:
+            image.draft('RGB', (round(width * scale), round(height * scale)))
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    partial = f'{target_path}.{os.getpid()}.{threading.get_ident()}.part'
+    options = dict(thumbnails.ENCODINGS.get(image_format, ('', '', {}))[2])
+    image.save(partial, image_format, **options)
+    os.replace(partial, target_path)
+
+
+def get_or_create(image_name, preset, extension):
+    """Путь к файлу нужного размера; создаёт его, если в кэше нет."""
+    key = cache_key(image_name, preset, extension)
+    path = cache_path(key, extension)
+    if _touch(path):
+        return path
+    lock_path = os.path.join(settings.IMAGE_RESIZE_CACHE_DIR, 'locks',
+                             f'{int(key, 16) % LOCK_STRIPES}.lock')
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'ab') as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            # Пока ждали блокировку, файл мог создать другой запрос.
+            if not _touch(path):
+                render(default_storage.path(image_name), path,
+                       settings.IMAGE_PRESETS[preset], EXTENSIONS[extension])
+                _written_bytes(os.path.getsize(path))
+        finally:
+            locks.unlock(lock)
+    return path
+
+
+def _touch(path):
+    """Отмечает файл как недавно использованный; False, если его нет."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _written_bytes(size):
+    # Обход каталога дорогой, поэтому чистим кэш после каждой записанной
+    # десятой части бюджета, а не после каждого файла.
+    global _written
+    with _written_lock:
+        _written += size
+        if _written < settings.IMAGE_RESIZE_CACHE_BYTES // 10:
+            return
+        _written = 0
+    evict()
+
+
+def _cache_files():
+    """(время изменения, размер, путь) каждого файла кэша."""
+    for root, _, names in os.walk(settings.IMAGE_RESIZE_CACHE_DIR):
+        if os.path.basename(root) == 'locks':
+            continue
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+
+def evict(budget=None):
+    """Удаляет давно не использованные файлы, пока кэш больше бюджета.
+
+    Возвращает число удалённых файлов.
+    """
+    if budget is None:
+        budget = settings.IMAGE_RESIZE_CACHE_BYTES
+    files = sorted(_cache_files())
+    total = sum(size for _, size, _ in files)
+    if total <= budget:
+        return 0
+    removed = 0
+    # Чистим с запасом, чтобы не обходить каталог после каждой записи.
+    target = budget * 9 // 10
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,182 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import storage
+
+from . import caching, counters, feed, thumbnails
+from .models import Comment, Counter, Follow, Group, Post, User
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    # При смене группы устаревают страницы и старой, и новой группы,
+    # при смене картинки нужна новая миниатюра.
+    instance._previous_group_id = None
+    instance._previous_image = None
+    if instance.pk and not raw:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image').first() or (None, None))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    scopes = caching.post_scopes(instance)
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id and previous_group_id != instance.group_id:
+        scopes.append(caching.group_scope(previous_group_id))
+    caching.bump(*scopes)
+    if raw:
+        return
+    if created:
+        counters.change(Counter.AUTHOR_POSTS, instance.author_id, 1)
+        if instance.group_id:
+            counters.change(Counter.GROUP_POSTS, instance.group_id, 1)
+        feed.push_post(instance)
+    elif previous_group_id != instance.group_id:
+        if previous_group_id:
+            counters.change(Counter.GROUP_POSTS, previous_group_id, -1)
+        if instance.group_id:
+            counters.change(Counter.GROUP_POSTS, instance.group_id, 1)
+    feed_scopes = feed.feed_scopes(instance)
+    caching.bump(*feed_scopes)
+    # Готовая миниатюра меняет и ленты подписчиков, и их ETag.
+    update_image(instance, feed_scopes)
+
+
+def update_image(post, feed_scopes):
+    previous_image = getattr(post, '_previous_image', None) or None
+    if (post.image.name or None) == previous_image:
+        return
+    if post.image:
+        storage.retain(post.image.name)
+        thumbnails.schedule(post, feed_scopes)
+    if previous_image:
+        release_image(previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def forget_post(sender, instance, **kwargs):
+    caching.bump(*caching.post_scopes(instance))
+    counters.change(Counter.AUTHOR_POSTS, instance.author_id, -1)
+    if instance.group_id:
+        counters.change(Counter.GROUP_POSTS, instance.group_id, -1)
+    counters.forget(Counter.POST_COMMENTS, instance.pk)
+    feed.forget_post(instance)
+    feed.bump_feeds(instance)
+    if instance.image:
+        release_image(instance.image.name)
+
+
+def release_image(name):
+    # Одну картинку могут использовать несколько постов: файл и его
+    # миниатюры удаляются вместе с последней ссылкой.
+    if storage.release(name):
+        thumbnails.forget(name)
+
+
+@receiver(post_save, sender=Comment)
+def add_comment(sender, instance, created, raw=False, **kwargs):
+    if instance.post_id:
+        caching.bump(caching.post_scope(instance.post_id))
+        if created and not raw:
+            counters.change(Counter.POST_COMMENTS, instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment(sender, instance, **kwargs):
+    if instance.post_id:
+        caching.bump(caching.post_scope(instance.post_id))
+        counters.change(Counter.POST_COMMENTS, instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(Counter.FOLLOWERS, instance.author_id, 1)
+        counters.change(Counter.FOLLOWING, instance.user_id, 1)
+        feed.backfill(instance.user_id, instance.author_id)
+        caching.bump(caching.feed_scope(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    counters.change(Counter.FOLLOWERS, instance.author_id, -1)
+    counters.change(Counter.FOLLOWING, instance.user_id, -1)
+    feed.remove_author(instance.user_id, instance.author_id)
+    caching.bump(caching.feed_scope(instance.user_id))
+
+
+# Поля автора и группы, которые видны в карточках и шапках страниц.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+GROUP_FIELDS = ('title', 'slug', 'description')
+
+
+def previous_values(model, instance, fields, update_fields):
+    if not instance.pk or (update_fields is not None
+                           and not set(fields) & set(update_fields)):
+        return None
+    return model.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+def card_scopes(author_ids, group_ids):
+    """Области, где видны карточки постов авторов из этих групп.
+
+    Общая лента, страницы авторов и групп и ленты подписчиков авторов.
+    """
+    return [
+        caching.GLOBAL,
+        *(caching.author_scope(author_id) for author_id in author_ids),
+        *(caching.group_scope(group_id) for group_id in group_ids),
+        *feed.authors_feed_scopes(author_ids),
+    ]
+
+
+@receiver(pre_save, sender=User)
+def remember_author_names(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    # Вход пользователя сохраняет только last_login - его не читаем.
+    instance._previous_names = None if raw else previous_values(
+        User, instance, AUTHOR_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=User)
+def rename_author(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_names', None)
+    current = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if previous is None or previous == current:
+        return
+    group_ids = Post.objects.filter(
+        author=instance, group__isnull=False).values_list(
+        'group_id', flat=True).order_by().distinct()
+    caching.bump(*card_scopes([instance.pk], group_ids))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_fields(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    instance._previous_fields = None if raw else previous_values(
+        Group, instance, GROUP_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=Group)
+def rename_group(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_fields', None)
+    current = tuple(getattr(instance, field) for field in GROUP_FIELDS)
+    if previous is None or previous == current:
+        return
+    author_ids = list(Post.objects.filter(group=instance).values_list(
+        'author_id', flat=True).order_by().distinct())
+    caching.bump(*card_scopes(author_ids, [instance.pk]))
+
+
+@receiver(post_delete, sender=User)
+def forget_user_counters(sender, instance, **kwargs):
+    for kind in (Counter.AUTHOR_POSTS, Counter.FOLLOWERS, Counter.FOLLOWING):
+        counters.forget(kind, instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+def forget_group_counters(sender, instance, **kwargs):
+    # Посты группы остаются без группы обычным UPDATE, без сигналов.
+    counters.forget(Counter.GROUP_POSTS, instance.pk)
@@ -0,0 +1,25 @@
+from django import template
+
+from core import tiered
+from posts import thumbnails
+
+register = template.Library()
+# Заглушка устареет, как только миниатюра будет готова: запрос с ней
+# помечается, и ни страница, ни фрагмент с ней не кэшируются.
+
+
+@register.simple_tag(takes_context=True)
+def card_image(context, post):
+    """Варианты миниатюры карточки; пусто, пока миниатюра не готова."""
+    image = thumbnails.get_card_image(post)
+    if post.image and image is None:
+        tiered.mark_stale(getattr(context, 'request', None))
+    return image
+
+
+@register.simple_tag(takes_context=True)
+def resolve_card_images(context, posts):
+    """Заранее находит миниатюры всех постов страницы."""
+    if thumbnails.resolve(posts):
+        tiered.mark_stale(getattr(context, 'request', None))
+    return ''
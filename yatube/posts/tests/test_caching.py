@@ -0,0 +1,198 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from core import tiered
+
+from .. import caching
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class GenerationCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Первая', slug='first', description='Описание')
+        self.other_group = Group.objects.create(
+            title='Вторая', slug='second', description='Описание')
+        self.post = Post.objects.create(
+            author=self.user, text='Исходный текст', group=self.group)
+        self.client = Client()
+
+    def test_bump_changes_only_given_scopes(self):
+        """Новое поколение получает только затронутая область."""
+        before = caching.generations(caching.GLOBAL, 'group:1', 'group:2')
+        caching.bump('group:1')
+        after = caching.generations(caching.GLOBAL, 'group:1', 'group:2')
+        self.assertEqual(after[caching.GLOBAL], before[caching.GLOBAL])
+        self.assertEqual(after['group:1'], before['group:1'] + 1)
+        self.assertEqual(after['group:2'], before['group:2'])
+
+    def test_new_comment_is_visible_at_once(self):
+        """Комментарий сразу виден на закэшированной странице поста."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Новый комментарий')
+        self.assertContains(self.client.get(url), 'Новый комментарий')
+
+    def test_moved_post_leaves_old_group_page(self):
+        """Пост, перенесённый в другую группу, пропадает со старой."""
+        old_url = reverse('posts:group_list', kwargs={'slug': 'first'})
+        new_url = reverse('posts:group_list', kwargs={'slug': 'second'})
+        self.assertContains(self.client.get(old_url), 'Исходный текст')
+        self.client.get(new_url)
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertNotContains(self.client.get(old_url), 'Исходный текст')
+        self.assertContains(self.client.get(new_url), 'Исходный текст')
+
+    def test_equal_generations_do_not_share_fragments(self):
+        """Группы и авторы с равными поколениями не делят фрагмент."""
+        Post.objects.create(
+            author=self.reader, text='Текст читателя', group=self.other_group)
+        scopes = [caching.group_scope(self.group.pk),
+                  caching.group_scope(self.other_group.pk),
+                  caching.author_scope(self.user.pk),
+                  caching.author_scope(self.reader.pk)]
+        cache.set_many({caching._key(scope): 1 for scope in scopes}, None)
+        pages = [
+            ('posts:group_list', {'slug': 'first'}, 'Исходный текст'),
+            ('posts:group_list', {'slug': 'second'}, 'Текст читателя'),
+            ('posts:profile', {'username': 'author'}, 'Исходный текст'),
+            ('posts:profile', {'username': 'reader'}, 'Текст читателя'),
+        ]
+        for name, kwargs, text in pages:
+            with self.subTest(name=name, kwargs=kwargs):
+                self.assertContains(
+                    self.client.get(reverse(name, kwargs=kwargs)), text)
+
+    def test_follow_starts_new_feed_generation(self):
+        """Подписка и отписка меняют поколение ленты читателя."""
+        scope = caching.feed_scope(self.reader.pk)
+        first = caching.generations(scope)[scope]
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        second = caching.generations(scope)[scope]
+        follow.delete()
+        third = caching.generations(scope)[scope]
+        self.assertLess(first, second)
+        self.assertLess(second, third)
+
+
+class BumpAfterCommitTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_repeats_after_commit(self):
+        """Поколение, прочитанное до коммита, устаревает после него."""
+        group = Group.objects.create(title='Группа', slug='group')
+        scope = caching.group_scope(group.pk)
+        before = caching.generations(scope)[scope]
+        with transaction.atomic():
+            Post.objects.create(author=User.objects.create_user('author'),
+                                text='Текст', group=group)
+            inside = caching.generations(scope)[scope]
+        self.assertEqual(inside, before + 1)
+        self.assertEqual(caching.generations(scope)[scope], before + 2)
+
+    def test_bump_outside_transaction_is_single(self):
+        """Вне транзакции поколение увеличивается один раз."""
+        scope = caching.group_scope(1)
+        before = caching.generations(scope)[scope]
+        caching.bump(scope)
+        self.assertEqual(caching.generations(scope)[scope], before + 1)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.post = Post.objects.create(
+            author=self.author, text='Текст', group=self.group)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        )
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_answer_304(self):
+        """Без изменений страницы отвечают 304 без тела."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_changes_invalidate_etag(self):
+        """Новый пост, комментарий и отписка меняют ETag своих страниц."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        Post.objects.create(author=self.author, text='Новый',
+                            group=self.group)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url,
+                                           HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+        profile = self.urls[2]
+        etag = self.client.get(profile)['ETag']
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.client.get(
+            profile, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_reader(self):
+        """Гость и читатель получают разные ETag одной страницы."""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(Client().get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stale_fragment_has_no_etag(self):
+        """Страница с прошлым фрагментом уходит без ETag и не кэшируется."""
+        add = cache.add
+
+        def lock_held(key, *args, **kwargs):
+            # Новое поколение фрагментов собирает другой процесс.
+            if key.startswith('tiered:lock:'):
+                return False
+            return add(key, *args, **kwargs)
+
+        for url in self.urls[:4]:
+            self.client.get(url)
+        Post.objects.create(author=self.author, text='Новый',
+                            group=self.group)
+        with mock.patch.object(tiered.cache, 'add', side_effect=lock_held):
+            for url in self.urls[:4]:
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertFalse(response.has_header('ETag'))
+                    self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(self.client.get(self.urls[0]).has_header('ETag'))
+
+    def test_missing_objects_still_404(self):
+        """Для несуществующих объектов ETag не считается, ответ 404."""
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'nobody'}),
+            HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .. import caching, thumbnails
+from ..models import Comment, Counter, Follow, Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class BenchmarkCommandsTest(TestCase):
+    def test_seed_data_and_bench_urls(self):
+        """seed_data наполняет базу, bench_urls обходит все адреса."""
+        call_command('seed_data', users=20, groups=3, posts=60, comments=40,
+                     follows=30, seed=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(Counter.objects.filter(
+            kind=Counter.AUTHOR_POSTS).exists())
+        cache.clear()
+        with tempfile.TemporaryDirectory(dir=settings.BASE_DIR) as directory:
+            media = override_settings(
+                MEDIA_ROOT=directory,
+                IMAGE_RESIZE_CACHE_DIR=os.path.join(directory, 'resized'))
+            with media, mock.patch.object(thumbnails, 'schedule'):
+                # Картинка поста отдаётся только для поста с картинкой.
+                path = os.path.join(directory, 'source.png')
+                Image.new('RGB', (60, 40), (255, 0, 0)).save(path)
+                with open(path, 'rb') as file:
+                    image = default_storage.save(
+                        'posts/source.png', ContentFile(file.read()))
+                Post.objects.filter(pk=Post.objects.first().pk).update(
+                    image=image)
+                output = os.path.join(directory, 'bench.json')
+                call_command('bench_urls', samples=2, output=output,
+                             stdout=StringIO(), stderr=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        routes = report['routes']
+        self.assertIn('posts:index', routes)
+        self.assertIn('posts:post_image', routes)
+        self.assertIn('users:signup', routes)
+        for result in routes.values():
+            self.assertIn(result['status'], (200, 302))
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(Post.objects.count(), 60)
+        # Поколения и фрагменты замера остались в его собственном кэше.
+        self.assertIsNone(cache.get(caching._key(caching.GLOBAL)))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RegenerateThumbnailsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, thumbnails.THUMBNAIL_DIR),
+                      ignore_errors=True)
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint.json')
+        author = User.objects.create_user(username='author')
+        self.images = []
+        with mock.patch.object(thumbnails, 'schedule'):
+            for color in ((255, 0, 0), (0, 255, 0), (255, 0, 0)):
+                path = os.path.join(TEMP_MEDIA_ROOT, 'source.png')
+                Image.new('RGB', (60, 40), color).save(path)
+                with open(path, 'rb') as file:
+                    name = default_storage.save(
+                        'posts/source.png', ContentFile(file.read()))
+                self.images.append(name)
+                Post.objects.create(author=author, text='Пост', image=name)
+
+    def regenerate(self, **options):
+        call_command('regenerate_thumbnails', workers=1, chunk_size=1,
+                     checkpoint=self.checkpoint, stdout=StringIO(),
+                     stderr=StringIO(), **options)
+
+    def test_renders_each_image_once_and_marks_ready(self):
+        """Одинаковые картинки обрабатываются один раз, рендер их видит."""
+        self.assertEqual(len(set(self.images)), 2)
+        self.regenerate()
+        for name in self.images:
+            for _, _, variant in thumbnails.variant_names(name):
+                self.assertTrue(default_storage.exists(variant))
+        posts = list(Post.objects.all())
+        with mock.patch.object(thumbnails, 'default_storage') as storage:
+            thumbnails.resolve(posts)
+        storage.exists.assert_not_called()
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_follower_feeds_get_new_generation(self):
+        """Ленты подписчиков с заглушками тоже устаревают."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=User.objects.get(
+            username='author'))
+        scope = caching.feed_scope(reader.pk)
+        before = caching.generations(scope)[scope]
+        self.regenerate()
+        self.assertGreater(caching.generations(scope)[scope], before)
+
+    def test_resumes_after_checkpoint(self):
+        """После перезапуска обрабатываются только посты за checkpoint."""
+        first, second, third = Post.objects.order_by('pk')
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'last_pk': second.pk}, file)
+        self.regenerate()
+        self.assertFalse(default_storage.exists(
+            thumbnails.thumbnail_name(second.image.name)))
+        self.assertTrue(default_storage.exists(
+            thumbnails.thumbnail_name(third.image.name)))
+
+
+class GcMediaTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        author = User.objects.create_user(username='author')
+        with mock.patch.object(thumbnails, 'schedule'):
+            self.post = Post.objects.create(
+                author=author, text='Пост',
+                image=default_storage.save('posts/used.jpg',
+                                           ContentFile(b'used')))
+        self.used = [self.post.image.name,
+                     thumbnails.thumbnail_name(self.post.image.name)]
+        self.orphans = ['posts/old.jpg',
+                        thumbnails.thumbnail_name('posts/old.jpg')]
+        # Миниатюры sorl-thumbnail: на них ссылается его таблица.
+        self.foreign = ['cache/ab/cd/sorl.jpg']
+        for name in self.used[1:] + self.orphans + self.foreign:
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'data')
+
+    def collect(self, **options):
+        call_command('gc_media', min_age=0, stdout=StringIO(), **options)
+
+    def assertFiles(self, names, exist):
+        for name in names:
+            self.assertEqual(
+                os.path.exists(os.path.join(self.media_root, name)), exist,
+                name)
+
+    def test_removes_only_orphans(self):
+        """Удаляются картинки без постов и их миниатюры, не больше."""
+        self.collect(dry_run=True)
+        self.assertFiles(self.orphans, exist=True)
+        self.collect()
+        self.assertFiles(self.used, exist=True)
+        self.assertFiles(self.orphans, exist=False)
+        self.assertFiles(self.foreign, exist=True)
+        self.assertFalse(os.path.exists(os.path.join(
+            self.media_root, os.path.dirname(self.orphans[1]))))
+
+    def test_quarantine_with_bloom_filter(self):
+        """Сироты переносятся в карантин, фильтр Блума не теряет ссылки."""
+        quarantine = os.path.join(self.media_root, 'quarantine')
+        self.collect(quarantine=quarantine, bloom=10)
+        self.assertFiles(self.used, exist=True)
+        self.assertFiles(self.orphans, exist=False)
+        for name in self.orphans:
+            self.assertTrue(os.path.exists(os.path.join(quarantine, name)))
+
+    def test_skips_recent_files(self):
+        """Свежие файлы не трогаются: их пост может быть ещё не сохранён."""
+        call_command('gc_media', stdout=StringIO())
+        self.assertFiles(self.orphans, exist=True)
@@ -0,0 +1,55 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import counters
+from ..models import Comment, Counter, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CounterTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Первая', slug='first', description='Описание')
+        self.other_group = Group.objects.create(
+            title='Вторая', slug='second', description='Описание')
+
+    def value(self, kind, object_id):
+        return Counter.objects.get(kind=kind, object_id=object_id).value
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.value(Counter.AUTHOR_POSTS, self.author.pk), 1)
+        self.assertEqual(self.value(Counter.GROUP_POSTS, self.group.pk), 1)
+        self.assertEqual(self.value(Counter.POST_COMMENTS, post.pk), 1)
+        self.assertEqual(self.value(Counter.FOLLOWERS, self.author.pk), 1)
+        self.assertEqual(self.value(Counter.FOLLOWING, self.reader.pk), 1)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(self.value(Counter.GROUP_POSTS, self.group.pk), 0)
+        self.assertEqual(
+            self.value(Counter.GROUP_POSTS, self.other_group.pk), 1)
+        post.delete()
+        Follow.objects.all().delete()
+        self.assertEqual(self.value(Counter.AUTHOR_POSTS, self.author.pk), 0)
+        self.assertEqual(self.value(Counter.FOLLOWERS, self.author.pk), 0)
+        self.assertFalse(Counter.objects.filter(
+            kind=Counter.POST_COMMENTS, object_id=post.pk).exists())
+
+    def test_reconcile_fixes_drift(self):
+        """reconcile_counters исправляет счётчики после bulk_create."""
+        Post.objects.create(author=self.author, text='Пост')
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(4))
+        self.assertEqual(counters.get(Counter.AUTHOR_POSTS, self.author.pk), 1)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(counters.get(Counter.AUTHOR_POSTS, self.author.pk), 5)
@@ -0,0 +1,187 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+
+from .. import feed
+from ..models import Celebrity, Follow, Group, Post, Timeline
+
+User = get_user_model()
+
+
+@override_settings(FEED_CELEBRITY_THRESHOLD=2,
+                   FEED_CELEBRITY_DEMOTE_THRESHOLD=2, FEED_RECENT_SIZE=3)
+class HybridFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.fan = User.objects.create_user(username='fan')
+        self.star = User.objects.create_user(username='star')
+        self.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.fan, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def read_feed(self):
+        posts = []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            response = self.client.get(reverse('posts:follow_index'), params)
+            page = response.context['page_obj']
+            posts.extend(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                return posts
+
+    def test_celebrity_posts_are_pulled_not_pushed(self):
+        """Посты популярного автора не пишутся в ленты, но видны в них."""
+        star_post = Post.objects.create(author=self.star, text='звезда')
+        author_post = Post.objects.create(author=self.author, text='автор')
+        self.assertFalse(Timeline.objects.filter(post=star_post).exists())
+        self.assertTrue(Timeline.objects.filter(
+            user=self.reader, post=author_post).exists())
+        self.assertEqual(self.read_feed(), [author_post, star_post])
+
+    def test_merged_feed_keeps_order_across_pages(self):
+        """Слияние лент сохраняет порядок и на страницах глубже кэша."""
+        for i in range(12):
+            Post.objects.create(author=self.star, text=f'звезда {i}')
+            Post.objects.create(author=self.author, text=f'автор {i}')
+        expected = list(Post.objects.filter(
+            author__in=[self.star, self.author]))
+        self.assertEqual(self.read_feed(), expected)
+
+    def test_previous_cursor_returns_to_first_page(self):
+        """Ссылка «Предыдущая» со второй страницы ведёт на первую."""
+        for i in range(12):
+            Post.objects.create(author=self.star, text=f'звезда {i}')
+            Post.objects.create(author=self.author, text=f'автор {i}')
+        url = reverse('posts:follow_index')
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        response = self.client.get(url, {'cursor': second.previous_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['page_obj']), list(first))
+
+    def test_former_celebrity_posts_stay_in_feeds(self):
+        """Посты автора, переставшего быть популярным, не пропадают."""
+        star_posts = [Post.objects.create(author=self.star, text=f'звезда {i}')
+                      for i in range(2)]
+        late = User.objects.create_user(username='late')
+        Follow.objects.create(user=late, author=self.star)
+        self.assertFalse(Timeline.objects.filter(user=late).exists())
+        # Отписки ничего не раскладывают: автор остаётся популярным.
+        Follow.objects.filter(user=self.fan).delete()
+        Follow.objects.filter(user=late).delete()
+        self.assertFalse(Timeline.objects.filter(author=self.star).exists())
+        self.assertEqual(self.read_feed(), star_posts[::-1])
+        call_command('demote_celebrities', chunk_size=1, stdout=StringIO())
+        self.assertFalse(Celebrity.objects.exists())
+        self.assertEqual(
+            set(Timeline.objects.filter(user=self.reader, author=self.star)
+                .values_list('post_id', flat=True)),
+            {post.pk for post in star_posts})
+        self.assertEqual(self.read_feed(), star_posts[::-1])
+
+    def test_demotion_waits_for_lower_threshold(self):
+        """Автор у самого порога остаётся популярным."""
+        Post.objects.create(author=self.star, text='звезда')
+        Follow.objects.filter(user=self.fan).delete()
+        with override_settings(FEED_CELEBRITY_DEMOTE_THRESHOLD=1):
+            call_command('demote_celebrities', stdout=StringIO())
+        self.assertTrue(Celebrity.objects.filter(author=self.star).exists())
+        self.assertFalse(Timeline.objects.filter(author=self.star).exists())
+
+    def test_new_celebrity_post_resets_recent_list(self):
+        """Новый пост не дописывается в список, а сбрасывает его."""
+        self.read_feed()
+        self.assertIsNotNone(cache.get(feed.recent_key(self.star.pk)))
+        post = Post.objects.create(author=self.star, text='звезда')
+        self.assertIsNone(cache.get(feed.recent_key(self.star.pk)))
+        self.assertEqual(self.read_feed(), [post])
+
+
+class FollowPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(author=self.author, text='Первый')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.url = reverse('posts:follow_index')
+
+    def feed_texts(self, **params):
+        response = self.client.get(self.url, params)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_repeated_page_is_served_from_cache(self):
+        """Повторный просмотр не строит ленту заново."""
+        self.assertEqual(self.feed_texts(), ['Первый'])
+        self.assertEqual(self.feed_texts(page=1), ['Первый'])
+        with self.assertNumQueries(3):
+            # Сессия, пользователь и популярные авторы для ключа,
+            # без запросов ленты и постов.
+            self.assertEqual(self.feed_texts(), ['Первый'])
+        self.assertEqual(self.feed_texts(page=1), ['Первый'])
+        self.assertEqual(metrics.lookups()['follow_page'],
+                         {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+    def test_no_stale_page_after_changes(self):
+        """Новый, изменённый и удалённый пост, подписки видны сразу."""
+        self.feed_texts()
+        second = Post.objects.create(author=self.author, text='Второй')
+        self.assertEqual(self.feed_texts(), ['Второй', 'Первый'])
+        second.text = 'Исправленный'
+        second.save()
+        self.assertEqual(self.feed_texts(), ['Исправленный', 'Первый'])
+        second.delete()
+        self.assertEqual(self.feed_texts(), ['Первый'])
+        Post.objects.create(author=self.other, text='Чужой')
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': 'other'}))
+        self.assertEqual(self.feed_texts(), ['Чужой', 'Первый'])
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': 'author'}))
+        self.assertEqual(self.feed_texts(), ['Чужой'])
+
+    def test_renamed_author_and_group_are_visible_at_once(self):
+        """Новые имя автора и название группы сразу видны в ленте."""
+        group = Group.objects.create(title='Старая', slug='group')
+        Post.objects.create(author=self.author, text='В группе', group=group)
+
+        def first_card():
+            post = self.client.get(self.url).context['page_obj'][0]
+            return post.author.get_full_name(), post.group.title
+
+        self.assertEqual(first_card(), ('', 'Старая'))
+        self.author.first_name = 'Лев'
+        self.author.save()
+        self.assertEqual(first_card(), ('Лев', 'Старая'))
+        group.title = 'Новая'
+        group.save()
+        self.assertEqual(first_card(), ('Лев', 'Новая'))
+
+    def test_login_does_not_read_names(self):
+        """Вход сохраняет last_login одним запросом, без чтения имён."""
+        with self.assertNumQueries(1):
+            self.author.save(update_fields=['last_login'])
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_celebrity_post_is_visible_at_once(self):
+        """Пост популярного автора меняет ключ, хотя ленты не трогаются."""
+        self.assertEqual(self.feed_texts(), ['Первый'])
+        Post.objects.create(author=self.author, text='Звёздный')
+        self.assertEqual(self.feed_texts(), ['Звёздный', 'Первый'])
@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(step):
+    # «SCAN t» без индекса - полный проход по таблице; SEARCH и
+    # «SCAN t USING INDEX» идут по индексу.
+    return step.startswith('SCAN') and 'INDEX' not in step
+
+
+class QueryPlanTest(TestCase):
+    """Ленты читаются по индексам, без полного прохода и сортировки."""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        for i in range(15):
+            post = Post.objects.create(
+                author=self.author, text=f'Пост {i}', group=self.group)
+            Comment.objects.create(post=post, author=self.reader, text='Да')
+        self.post = post
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def assert_indexed(self, url, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            plan = query_plan(sql)
+            with self.subTest(url=url, sql=sql):
+                sorted_in_memory = any('TEMP B-TREE' in step for step in plan)
+                full_scan = any(is_full_scan(step) for step in plan)
+                self.assertFalse(sorted_in_memory and full_scan, plan)
+        return response
+
+    def test_post_views_use_indexes(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            response = self.assert_indexed(url)
+            next_cursor = getattr(
+                response.context['page_obj'], 'next_cursor', None) if (
+                'page_obj' in response.context) else None
+            if next_cursor:
+                self.assert_indexed(url, {'cursor': next_cursor})
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class QueryCountTest(TestCase):
+    """Число запросов страницы не зависит от числа постов и комментариев."""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.author = User.objects.create_user(username='author0')
+        self.post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group)
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.authors = 0
+        self.add_rows(2)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.authors += 1
+            author = User.objects.create_user(
+                username=f'author{self.authors}')
+            group = Group.objects.create(
+                title=f'Группа {self.authors}',
+                slug=f'group{self.authors}',
+                description='Описание')
+            Post.objects.create(author=author, text='Пост', group=group)
+            Post.objects.create(author=self.author, text='Пост',
+                                group=self.group)
+            Follow.objects.create(user=self.reader, author=author)
+            Comment.objects.create(post=self.post, author=author, text='Да')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_post_views_do_constant_queries(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                before = self.count_queries(url)
+                self.add_rows(5)
+                self.assertEqual(self.count_queries(url), before)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import resize, thumbnails
+from ..models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CACHE_DIR = os.path.join(TEMP_MEDIA_ROOT, 'resize_cache')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   IMAGE_RESIZE_CACHE_DIR=CACHE_DIR)
+class PostImageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), (0, 90, 200)).save(buffer, 'JPEG')
+        name = default_storage.save('posts/photo.jpg',
+                                    ContentFile(buffer.getvalue()))
+        author = User.objects.create_user(username='author')
+        with mock.patch.object(thumbnails, 'schedule'):
+            self.post = Post.objects.create(author=author, text='Пост',
+                                            image=name)
+        self.client = Client()
+
+    def url(self, preset='avatar', extension='jpg'):
+        return reverse('posts:post_image', kwargs={
+            'post_id': self.post.pk, 'preset': preset,
+            'extension': extension})
+
+    def test_preset_is_rendered_once_and_served_from_disk(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as im:
+            self.assertEqual(im.size, settings.IMAGE_PRESETS['avatar'])
+        with mock.patch.object(resize, 'render') as render:
+            again = self.client.get(self.url())
+            b''.join(again.streaming_content)
+        render.assert_not_called()
+        self.assertEqual(again['ETag'], response['ETag'])
+        cached = self.client.get(self.url(),
+                                 HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_unknown_preset_or_format(self):
+        self.assertEqual(self.client.get(self.url('huge')).status_code, 404)
+        self.assertEqual(
+            self.client.get(self.url(extension='tiff')).status_code, 404)
+
+    def test_concurrent_misses_render_once(self):
+        """Параллельные промахи одного размера создают файл один раз."""
+        original = resize.render
+        calls = []
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.05)
+            original(*args)
+
+        with mock.patch.object(resize, 'render', side_effect=slow_render):
+            threads = [threading.Thread(
+                target=resize.get_or_create,
+                args=(self.post.image.name, 'preview', 'jpg'))
+                for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_evict_removes_least_recently_used(self):
+        old = resize.get_or_create(self.post.image.name, 'avatar', 'jpg')
+        fresh = resize.get_or_create(self.post.image.name, 'medium', 'jpg')
+        os.utime(old, (1, 1))
+        removed = resize.evict(budget=os.path.getsize(fresh) * 10 // 9 + 1)
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(fresh))
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import caching, thumbnails
+from ..models import Follow, Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def png_bytes(size):
+    path = os.path.join(TEMP_MEDIA_ROOT, 'source.png')
+    Image.new('RGB', size, (200, 30, 30)).save(path)
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client = Client()
+
+    def render(self, name):
+        thumbnails.render_variants(default_storage.path(name),
+                                   thumbnails.variant_targets(name))
+
+    def test_render_variants_keep_card_crop(self):
+        """Все варианты - обрезка 960x339 нужной ширины и формата."""
+        name = default_storage.save('posts/small.png',
+                                    ContentFile(png_bytes((100, 80))))
+        self.render(name)
+        variants = thumbnails.variant_names(name)
+        self.assertEqual(len(variants), len(thumbnails.FORMATS) * len(
+            thumbnails.CARD_WIDTHS))
+        for image_format, width, variant in variants:
+            self.assertTrue(variant.startswith('posts/'))
+            with Image.open(default_storage.path(variant)) as image:
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(image.size, thumbnails.card_size(width))
+        self.assertEqual(thumbnails.card_size(960), thumbnails.CARD_SIZE)
+
+    def test_saving_post_schedules_thumbnail(self):
+        """Миниатюра ставится в очередь при новой картинке, не при правке."""
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               side_effect=lambda callback: callback()), \
+                mock.patch.object(thumbnails, '_submit') as submit:
+            post = Post.objects.create(author=self.author, text='Пост',
+                                       image='posts/a.png')
+            post.text = 'Правка'
+            post.save()
+            post.image = 'posts/b.png'
+            post.save()
+            Post.objects.create(author=self.author, text='Без картинки')
+        self.assertEqual([call.args[0] for call in submit.call_args_list],
+                         ['posts/a.png', 'posts/b.png'])
+
+    def test_page_shows_placeholder_until_ready(self):
+        """Страница не создаёт миниатюру, а показывает заглушку."""
+        name = default_storage.save('posts/card.png',
+                                    ContentFile(png_bytes((50, 50))))
+        post = Post.objects.create(author=self.author, text='Пост',
+                                   image=name)
+        with mock.patch.object(thumbnails, 'render_variants') as render:
+            response = self.client.get(reverse('posts:index'))
+        render.assert_not_called()
+        thumbnail = thumbnails.thumbnail_name(name)
+        self.assertNotContains(response, thumbnail)
+        self.assertContains(response, 'aspect-ratio')
+        self.render(name)
+        response = self.client.get(reverse('posts:post_detail',
+                                           args=(post.pk,)))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, default_storage.url(thumbnail))
+        small = thumbnails.thumbnail_name(name, thumbnails.card_size(480))
+        self.assertContains(response, f'{default_storage.url(small)} 480w')
+
+    def test_placeholder_pages_are_not_cached(self):
+        """Страница с заглушкой не сохраняется и не получает ETag."""
+        name = default_storage.save('posts/late.png',
+                                    ContentFile(png_bytes((50, 30))))
+        Post.objects.create(author=self.author, text='Пост', image=name)
+        with mock.patch.object(thumbnails, '_submit'):
+            response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'aspect-ratio')
+        # Процесс пула упал и не начал новое поколение страниц.
+        self.render(name)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_old_post_thumbnail_refreshes_follower_feeds(self):
+        """Миниатюра поста старше очереди обновляет и ленты подписчиков."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        name = default_storage.save('posts/old.png',
+                                    ContentFile(png_bytes((30, 20))))
+        with mock.patch.object(thumbnails, 'schedule'):
+            post = Post.objects.create(author=self.author, text='Пост',
+                                       image=name)
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               side_effect=lambda callback: callback()), \
+                mock.patch.object(thumbnails, '_submit') as submit:
+            thumbnails.resolve([post])
+        self.assertIn(caching.feed_scope(reader.pk), submit.call_args.args[1])
+
+    def test_resolve_reads_ready_marks_in_bulk(self):
+        """Готовые миниатюры страницы находятся одним get_many."""
+        posts = []
+        for i in range(3):
+            name = default_storage.save(f'posts/bulk{i}.png',
+                                        ContentFile(png_bytes((20, 20))))
+            self.render(name)
+            posts.append(Post.objects.create(
+                author=self.author, text='Пост', image=name))
+        thumbnails.resolve(posts)
+        self.assertTrue(all(post.card_image for post in posts))
+        fresh = list(Post.objects.filter(pk__in=[post.pk for post in posts]))
+        with mock.patch.object(thumbnails, 'default_storage') as storage, \
+                mock.patch.object(thumbnails.cache, 'get_many',
+                                  wraps=thumbnails.cache.get_many) as bulk:
+            thumbnails.resolve(fresh)
+        storage.exists.assert_not_called()
+        bulk.assert_called_once()
+        self.assertTrue(all(post.card_image for post in fresh))
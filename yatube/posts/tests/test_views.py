@@ -8,8 +8,11 @@ from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, Follow
+from .. import thumbnails
+from ..models import Group, Post, Follow, Timeline
 
 User = get_user_model()
 TEST_OF_POST = 13
@@ -172,21 +175,38 @@ class PostViewsTests(TestCase):
 
     def test_index_cache_context(self):
         """Проверка кэширования страницы index"""
+        # Страница с заглушкой миниатюры не кэшируется.
+        thumbnails.mark_ready([self.post.image.name])
         before_create_post = self.authorized_client.get(
             reverse('posts:index'))
         first_item_before = before_create_post.content
-        Post.objects.create(
-            author=self.user,
-            text='Проверка кэша',
-            group=self.group,
-            image=self.uploaded
-        )
+        # update() не шлёт сигналов, версия страницы остаётся прежней.
+        Post.objects.filter(pk=self.post.pk).update(text='Проверка кэша')
         after_create_post = self.authorized_client.get(reverse('posts:index'))
         first_item_after = after_create_post.content
         self.assertEqual(first_item_after, first_item_before)
         cache.clear()
         after_clear = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(first_item_after, after_clear)
+        self.assertNotEqual(first_item_after, after_clear.content)
+
+    def test_index_cache_shows_new_post(self):
+        """Новый пост сразу виден на закэшированной странице index"""
+        self.authorized_client.get(reverse('posts:index'))
+        Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свежий пост')
+
+    def test_index_queries_do_not_grow_with_posts(self):
+        """Главная читает только текущую страницу"""
+        query_counts = []
+        for _ in range(2):
+            Post.objects.bulk_create(
+                Post(author=self.user, text=f'Пост {i}') for i in range(30))
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.unauthorized_client.get(reverse('posts:index'))
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
 
 
 class PaginatorViewsTest(TestCase):
@@ -224,6 +244,29 @@ class PaginatorViewsTest(TestCase):
             self.assertEqual(count_posts1, FIRST_OF_POSTS)
             self.assertEqual(count_posts2, TEST_OF_POST - FIRST_OF_POSTS)
 
+    def test_cursor_pages_follow_post_ordering(self):
+        """Курсоры ведут вперёд и назад по ленте без пропусков."""
+        expected = list(Post.objects.all())
+        response1 = self.client.get(reverse('posts:index'))
+        page1 = response1.context['page_obj']
+        self.assertEqual(list(page1), expected[:FIRST_OF_POSTS])
+        self.assertIsNone(page1.previous_cursor)
+        response2 = self.client.get(
+            reverse('posts:index'), {'cursor': page1.next_cursor})
+        page2 = response2.context['page_obj']
+        self.assertEqual(list(page2), expected[FIRST_OF_POSTS:])
+        self.assertIsNone(page2.next_cursor)
+        response3 = self.client.get(
+            reverse('posts:index'), {'cursor': page2.previous_cursor})
+        self.assertEqual(list(response3.context['page_obj']),
+                         expected[:FIRST_OF_POSTS])
+
+    def test_broken_cursor_opens_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']), FIRST_OF_POSTS)
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -284,3 +327,23 @@ class FollowViewsTest(TestCase):
             reverse('posts:follow_index'))
         new_posts = response_follower.context['page_obj']
         self.assertIn(new_post_follower, new_posts)
+
+    def test_follow_backfills_and_unfollow_cleans_timeline(self):
+        """Подписка подтягивает старые посты автора, отписка их убирает."""
+        old_post = Post.objects.create(
+            author=FollowViewsTest.author,
+            text='Пост до подписки')
+        self.authorized_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': FollowViewsTest.author.username}))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(old_post, response.context['page_obj'])
+        self.assertTrue(Timeline.objects.filter(
+            user=FollowViewsTest.user, post=old_post).exists())
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': FollowViewsTest.author.username}))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertNotIn(old_post, response.context['page_obj'])
+        self.assertFalse(Timeline.objects.filter(
+            user=FollowViewsTest.user).exists())
@@ -0,0 +1,278 @@
+"""Миниатюры картинок постов.
+
+Миниатюры карточки создаются после сохранения поста в отдельном
+процессе, а не при первом показе страницы. Пока файлов нет, шаблон
+показывает заглушку, а готовые файлы ищутся по имени в хранилище: запрос
+страницы никогда не декодирует и не сжимает картинки.
+
+Из одной обрезки 960x339 делаются варианты нескольких ширин: JPEG для
+всех браузеров и WebP и AVIF, если их умеет сохранять Pillow. Шаблон
+отдаёт их в <picture> со srcset, и браузер берёт самый лёгкий.
+
+Готовые миниатюры отмечаются в кэше, и страница проверяет их все разом
+одним get_many; к хранилищу обращаемся только за ещё не отмеченными.
+Страница и фрагменты с заглушкой не кэшируются (tiered.mark_stale): иначе
+они пережили бы миниатюру, если её процесс упал и не начал новое
+поколение.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+CARD_SIZE = (960, 339)
+CARD_WIDTHS = (480, 960)
+THUMBNAIL_DIR = 'posts/thumbnails'
+# Формат Pillow: расширение, MIME-тип и параметры сохранения.
+ENCODINGS = {
+    'AVIF': ('avif', 'image/avif', {'quality': 60}),
+    'WEBP': ('webp', 'image/webp', {'quality': 80, 'method': 6}),
+    'JPEG': ('jpg', 'image/jpeg', {'quality': 85, 'optimize': True,
+                                   'progressive': True}),
+}
+
+_lock = threading.Lock()
+_pool = None
+_pending = set()
+
+
+def _formats():
+    """Форматы от самого лёгкого к JPEG, который сохраняется всегда."""
+    Image.init()
+    return [name for name in ENCODINGS
+            if name == 'JPEG' or name in Image.SAVE]
+
+
+FORMATS = _formats()
+
+
+def card_size(width):
+    """Размер варианта той же пропорции, что и карточка 960x339."""
+    return width, round(width * CARD_SIZE[1] / CARD_SIZE[0])
+
+
+def thumbnail_name(image_name, size=CARD_SIZE, image_format='JPEG'):
+    """Имя варианта зависит только от исходного файла, размера и формата."""
+    digest = hashlib.md5(image_name.encode()).hexdigest()
+    extension = ENCODINGS[image_format][0]
+    return (f'{THUMBNAIL_DIR}/{digest[:2]}/{digest}/'
+            f'{size[0]}x{size[1]}.{extension}')
+
+
+def variant_names(image_name):
+    """Все варианты картинки: (формат, ширина, имя файла)."""
+    return [(image_format, width,
+             thumbnail_name(image_name, card_size(width), image_format))
+            for image_format in FORMATS for width in CARD_WIDTHS]
+
+
+def variant_targets(image_name):
+    """Задания для render_variants: (путь, размер, формат).
+
+    Карточка 960x339 в JPEG пишется последней и служит признаком
+    готовности всех вариантов.
+    """
+    card = thumbnail_name(image_name)
+    targets = [(default_storage.path(name), card_size(width), image_format)
+               for image_format, width, name in variant_names(image_name)
+               if name != card]
+    targets.append((default_storage.path(card), CARD_SIZE, 'JPEG'))
+    return targets
+
+
+def _ready_key(name):
+    return f'thumbnail:{name}'
+
+
+def mark_ready(image_names):
+    """Отмечает миниатюры картинок готовыми одним set_many."""
+    cache.set_many({_ready_key(thumbnail_name(name)): True
+                    for name in image_names}, None)
+
+
+def unmark(names):
+    """Снимает отметки готовности с удалённых файлов миниатюр."""
+    cache.delete_many([_ready_key(name) for name in names])
+
+
+def render_job(job):
+    """Задание для пула: (имя, путь, варианты) -> (имя, ошибка)."""
+    image_name, source_path, targets = job
+    try:
+        render_variants(source_path, targets)
+    except Exception as error:
+        return image_name, f'{type(error).__name__}: {error}'
+    return image_name, None
+
+
+def render_variants(source_path, targets):
+    """Обрезка по центру с увеличением, как crop="center" upscale=True.
+
+    targets - список (путь, размер, формат). Картинка декодируется один
+    раз на все варианты. Выполняется в процессе пула и работает только с
+    путями файлов, без Django, поэтому процессу не нужны ни настройки,
+    ни база.
+    """
+    from PIL import ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    for target_path, size, image_format in targets:
+        variant = ImageOps.fit(image, size, Image.LANCZOS,
+                               centering=(0.5, 0.5))
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Пишем во временный файл и переименовываем: читатели не увидят
+        # недописанную миниатюру.
+        partial = f'{target_path}.{os.getpid()}.part'
+        variant.save(partial, image_format, **ENCODINGS[image_format][2])
+        os.replace(partial, target_path)
+    return [target[0] for target in targets]
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn, а не fork: дочерний процесс не наследует соединения
+            # с базой и потоки сервера.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _finished(name, scopes, future):
+    with _lock:
+        _pending.discard(name)
+    error = future.exception()
+    if error is not None:
+        logger.error('Не удалось создать миниатюру %s: %s', name, error)
+        return
+    cache.set(_ready_key(name), True, None)
+    # Ленты и страницы, прочитавшие поколение до отметки, устаревают.
+    caching.bump(*scopes)
+
+
+def _submit(image_name, scopes):
+    name = thumbnail_name(image_name)
+    if default_storage.exists(name):
+        # Та же картинка уже загружалась: миниатюры общие.
+        cache.set(_ready_key(name), True, None)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    try:
+        future = _get_pool().submit(
+            render_variants, default_storage.path(image_name),
+            variant_targets(image_name))
+    except Exception:
+        with _lock:
+            _pending.discard(name)
+        logger.exception('Очередь миниатюр недоступна')
+        return
+    future.add_done_callback(
+        lambda done: _finished(name, scopes, done))
+
+
+def schedule(post, extra_scopes=()):
+    """Ставит миниатюру картинки поста в очередь после коммита.
+
+    extra_scopes - области кэша, которые тоже устареют, когда миниатюра
+    будет готова (помимо областей самого поста).
+    """
+    if not post.image:
+        return
+    image_name = post.image.name
+    scopes = caching.post_scopes(post) + list(extra_scopes)
+    transaction.on_commit(lambda: _submit(image_name, scopes))
+
+
+def forget(image_name):
+    """Удаляет варианты картинки после коммита."""
+    names = [name for _, _, name in variant_names(image_name)]
+    cache.delete(_ready_key(thumbnail_name(image_name)))
+
+    def delete():
+        for name in names:
+            default_storage.delete(name)
+    transaction.on_commit(delete)
+
+
+def card_image(image_name):
+    """Адреса вариантов для разметки <picture>.
+
+    Адреса получаются из имён файлов без обращения к хранилищу.
+    """
+    sources = {}
+    for image_format, width, name in variant_names(image_name):
+        sources.setdefault(image_format, []).append(
+            f'{default_storage.url(name)} {width}w')
+    return {
+        'src': default_storage.url(thumbnail_name(image_name)),
+        'width': CARD_SIZE[0],
+        'height': CARD_SIZE[1],
+        'srcset': ', '.join(sources.pop('JPEG')),
+        'sources': [{'type': ENCODINGS[image_format][1],
+                     'srcset': ', '.join(srcset)}
+                    for image_format, srcset in sources.items()],
+    }
+
+
+def _schedule_existing(post):
+    """Ставит в очередь миниатюру поста, сохранённого до очереди."""
+    # feed импортирует модели, а этот модуль импортирует и процесс пула.
+    from . import feed
+
+    schedule(post, feed.feed_scopes(post))
+
+
+def resolve(posts):
+    """Находит миниатюры всех постов страницы разом.
+
+    Варианты готовой миниатюры или None записываются в card_image поста.
+    Отмеченные в кэше миниатюры берутся одним get_many, файлы остальных
+    проверяются в хранилище и отмечаются одним set_many. Возвращает
+    число постов с заглушкой.
+    """
+    posts = [post for post in posts if post.image]
+    keys = {post.pk: _ready_key(thumbnail_name(post.image.name))
+            for post in posts}
+    found = cache.get_many(keys.values())
+    ready = {}
+    placeholders = 0
+    for post in posts:
+        image = None
+        if keys[post.pk] in found:
+            image = card_image(post.image.name)
+        elif default_storage.exists(thumbnail_name(post.image.name)):
+            ready[keys[post.pk]] = True
+            image = card_image(post.image.name)
+        elif default_storage.exists(post.image.name):
+            # Пост старше очереди миниатюр.
+            _schedule_existing(post)
+        placeholders += image is None
+        post.card_image = image
+    if ready:
+        cache.set_many(ready, None)
+    return placeholders
+
+
+def get_card_image(post):
+    """Варианты миниатюры поста или None, если их ещё нет."""
+    if not hasattr(post, 'card_image'):
+        resolve([post])
+    return getattr(post, 'card_image', None)
@@ -1,82 +1,145 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import FileResponse, Http404
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
 
+from . import caching, conditional, counters, feed, resize
 from .forms import PostForm, CommentForm
-from .models import Post, Group, Follow
+from .models import Counter, Post, Group, Follow
+from .paginator import CountedPaginator, CursorPaginator
 
+POSTS_PER_PAGE = 10
 
-def get_page_context(queryset, request):
-    paginator = Paginator(queryset, 10)
+
+def get_page_context(queryset, request, cursor_paginator=None, counter=None):
+    """Страница ленты по ?cursor=, старые ссылки ?page= работают как раньше.
+
+    counter - пара (вид, id) счётчика, который заменяет COUNT(*)
+    при выводе по номеру страницы.
+    """
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return {'page_obj': page_obj}
+    if page_number is not None and 'cursor' not in request.GET:
+        count = counters.get(*counter) if counter else None
+        paginator = CountedPaginator(queryset, POSTS_PER_PAGE, count=count)
+        return {'page_obj': paginator.get_page(page_number)}
+    paginator = (cursor_paginator
+                 or CursorPaginator(queryset, POSTS_PER_PAGE))
+    return {'page_obj': paginator.get_cursor_page(request.GET.get('cursor'))}
 
 
+@conditional.etag(conditional.index)
 def index(request):
-    posts = Post.objects.all()
-    context = {'posts': posts}
-    context.update(get_page_context(Post.objects.all(), request))
+    cache_version = caching.page_version(request, caching.GLOBAL)
+    context = get_page_context(Post.objects.cards(), request)
+    context.update({
+        'posts': context['page_obj'].object_list,
+        'cache_version': cache_version,
+        'page_key': caching.page_key(request),
+    })
     return render(request, 'posts/index.html', context)
 
 
+@conditional.etag(conditional.group_posts)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
-    context = {
+    cache_version = caching.page_version(request,
+                                         caching.group_scope(group.pk))
+    context = get_page_context(
+        Post.objects.cards().filter(group=group), request,
+        counter=(Counter.GROUP_POSTS, group.pk))
+    context.update({
         'group': group,
-        'posts': posts,
-    }
-    context.update(get_page_context(Post.objects.filter(group=group), request))
+        'posts': context['page_obj'].object_list,
+        'cache_version': cache_version,
+        'page_key': caching.page_key(request),
+    })
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional.etag(conditional.profile)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts_sum = author.posts.count()
-    post_list = author.posts.select_related('group').all()
+    cache_version = caching.page_version(request,
+                                         caching.author_scope(author.pk))
+    posts_sum = counters.get(Counter.AUTHOR_POSTS, author.pk)
     following = (request.user.is_authenticated
                  and Follow.objects.filter(
                      user=request.user,
                      author=author).exists())
-    context = {'author': author,
-               'posts_sum': posts_sum,
-               'post_list': post_list,
-               'following': following,
-               }
-    context.update(get_page_context(
-        author.posts.select_related('group').all(), request))
+    context = get_page_context(
+        author.posts.cards(), request,
+        counter=(Counter.AUTHOR_POSTS, author.pk))
+    context.update({'author': author,
+                    'posts_sum': posts_sum,
+                    'post_list': context['page_obj'].object_list,
+                    'following': following,
+                    'cache_version': cache_version,
+                    'page_key': caching.page_key(request),
+                    })
     return render(request, 'posts/profile.html', context)
 
 
+@conditional.etag(conditional.post_detail)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.cards(), id=post_id)
+    # Поколение автора - из-за числа его постов на странице.
+    cache_version = caching.page_version(
+        request, caching.post_scope(post.pk),
+        caching.author_scope(post.author_id))
+    comments = post.comments.for_list()
     form = CommentForm()
-    post_count = post.author.posts.count()
+    post_count = counters.get(Counter.AUTHOR_POSTS, post.author_id)
     context = {'post': post,
                'form': form,
                'comments': comments,
                'post_count': post_count,
+               'cache_version': cache_version,
                }
     return render(request, 'posts/post_detail.html', context)
 
 
+@require_safe
+def post_image(request, post_id, preset, extension):
+    """Картинка поста размера из IMAGE_PRESETS, из дискового кэша."""
+    if (preset not in settings.IMAGE_PRESETS
+            or extension not in resize.EXTENSIONS):
+        raise Http404
+    post = get_object_or_404(Post.objects.only('image'), pk=post_id)
+    if not post.image:
+        raise Http404
+    # Ключ зависит от имени картинки, а имя - от её содержимого.
+    etag = f'"{resize.cache_key(post.image.name, preset, extension)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            path = resize.get_or_create(post.image.name, preset, extension)
+        except FileNotFoundError:
+            raise Http404
+        response = FileResponse(open(path, 'rb'),
+                                content_type=resize.content_type(extension))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
         return redirect('posts:profile', username=request.user)
-    else:
-        form = PostForm()
     context = {'form': form}
     return render(request, 'posts/create_post.html', context)
 
 
+@transaction.atomic
 def post_edit(request, post_id):
     poster = get_object_or_404(Post, pk=post_id)
     is_edit = 'is_edit'
@@ -102,6 +165,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -114,17 +178,25 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional.etag(conditional.follow_index)
 def follow_index(request):
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {"page_obj": page_obj}
-    return render(request, template, context)
+
+    def build_page():
+        post_list = Post.objects.cards().filter(
+            author__following__user=request.user)
+        return get_page_context(
+            post_list, request,
+            cursor_paginator=feed.FeedPaginator(
+                request.user, POSTS_PER_PAGE))['page_obj']
+
+    page_obj = feed.cached_page(request.user, caching.page_key(request),
+                                build_page, POSTS_PER_PAGE)
+    return render(request, template, {'page_obj': page_obj})
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
@@ -134,6 +206,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     user = request.user
     Follow.objects.filter(user=user, author__username=username).delete()
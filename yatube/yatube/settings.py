@@ -46,7 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,6 +75,16 @@ TEMPLATES = [
         },
     },
 ]
+if not DEBUG:
+    # Каждый шаблон компилируется один раз на процесс; wsgi.py компилирует
+    # все шаблоны при запуске.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
@@ -90,6 +102,27 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+# сколько фрагментов и страниц держим в памяти процесса перед общим кэшем;
+# при LocMemCache общий кэш и так в памяти процесса
+TIERED_CACHE_LOCAL_ENTRIES = 0
+# сколько секунд гости получают готовые страницы постов; 0 - не кэшировать
+# (при разработке правки шаблонов должны быть видны сразу)
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 0
+ANONYMOUS_PAGE_CACHE_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+)
+if not DEBUG:
+    # Один кэш на все процессы сервера: поколения и попадания общие.
+    CACHES['default'] = {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_BYTES': 256 * 1024 * 1024},
+    }
+    TIERED_CACHE_LOCAL_ENTRIES = 1000
+    ANONYMOUS_PAGE_CACHE_TIMEOUT = 10 * 60
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,7 +168,49 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Доля запросов, для которых собираются замеры и Server-Timing
+PERFORMANCE_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# файлы называются по хэшу содержимого и хранятся в одном экземпляре
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# загрузки всегда пишутся во временный файл, а не в память
+FILE_UPLOAD_HANDLERS = ['core.uploads.LimitedTemporaryFileUploadHandler']
+# сколько байт принимаем в одном загружаемом файле
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+# больше пикселей не бывает у настоящих фотографий, это «бомба»
+IMAGE_MAX_PIXELS = 100_000_000
+# оригиналы с большей стороной уменьшаются при загрузке
+IMAGE_MAX_SIDE = 2560
+# предел памяти под пиксели при уменьшении одной загрузки
+IMAGE_UPLOAD_MEMORY_LIMIT = 64 * 1024 * 1024
+
+# сколько последних постов автора попадает в ленту при подписке
+FEED_BACKFILL_SIZE = 100
+# с какого числа подписчиков посты автора не раскладываются по лентам,
+# а подмешиваются в ленту при чтении
+FEED_CELEBRITY_THRESHOLD = 10000
+# ниже какого числа подписчиков команда demote_celebrities снова
+# раскладывает посты популярного автора по лентам
+FEED_CELEBRITY_DEMOTE_THRESHOLD = 8000
+# сколько свежих постов популярного автора держим в кэше
+FEED_RECENT_SIZE = 200
+# сколько секунд храним готовую страницу ленты подписок; устаревает она
+# раньше, со сменой поколения ленты
+FEED_PAGE_CACHE_TIMEOUT = 15 * 60
+
+# сколько процессов создают миниатюры картинок постов
+THUMBNAIL_WORKERS = 2
+
+# размеры картинок постов, которые можно запросить по адресу
+IMAGE_PRESETS = {
+    'avatar': (96, 96),
+    'preview': (320, 180),
+    'medium': (640, 360),
+}
+# дисковый кэш картинок по запросу и его предельный размер
+IMAGE_RESIZE_CACHE_DIR = os.path.join(BASE_DIR, 'resize_cache')
+IMAGE_RESIZE_CACHE_BYTES = 512 * 1024 * 1024
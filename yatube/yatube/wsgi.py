@@ -13,4 +13,18 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
-application = get_wsgi_application()
+from django.conf import settings  # noqa: E402
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+
+from core import templating  # noqa: E402
+from core.media import MediaApplication  # noqa: E402
+
+# Медиафайлы отдаются до Django, без middleware.
+application = MediaApplication(get_wsgi_application())
+
+if not settings.DEBUG:
+    # Наполняем кэш загрузчика шаблонов до первого запроса.
+    errors = templating.compile_all()
+    if errors:
+        raise ImproperlyConfigured('; '.join(
+            f'{name}: {error}' for name, error in errors))